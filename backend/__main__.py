@@ -0,0 +1,57 @@
+"""
+Runs the API server, optionally with several worker processes:
+
+    python -m backend --workers 4
+
+With more than one worker, per-database data versions and cache invalidations go through a
+shared SQLite file (shared_state.py), writers to a user database take a file lock, and each
+process divides the LLM limits by the number of workers.
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backend", description="Run the API server.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("BACKEND_WORKERS", "1")),
+        help="worker processes; 0 uses one per CPU (default: BACKEND_WORKERS or 1)",
+    )
+    parser.add_argument("--host", default=os.getenv("BACKEND_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("BACKEND_PORT", "8000")))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    if workers < 0:
+        sys.exit("--workers must be 0 or more")
+
+    # The modules use relative paths (users.db, user_databases/), like `uvicorn main:app` run from this directory
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    # Read by shared_state at import, here and in every worker process
+    os.environ["BACKEND_WORKERS"] = str(workers)
+    if workers > 1:
+        os.environ.setdefault("SHARED_STATE_PATH", os.path.abspath("shared_state.db"))
+
+    import uvicorn
+
+    if workers > 1:
+        # Create the tables once before the workers race to, and fail the jobs the last run left running
+        import main  # noqa: F401
+        import jobs
+
+        jobs.fail_interrupted_jobs()
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import sqlite3
 import re
-from openai import AsyncOpenAI
+import time
 import dynamic_db
+import sqlite_pool
+import llm_gateway
+import schema_context
+import index_advisor
+import metrics
 import os
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv() 
@@ -11,22 +17,26 @@ AI_BASE_URL = "https://api.groq.com/openai/v1"
 AI_MODEL = "llama-3.1-8b-instant"
 API_KEY = os.getenv("AGENT_API_KEY") # set in .env file as DEEPSEEK_API_KEY=your_api_key_here
 
-client = AsyncOpenAI(base_url=AI_BASE_URL, api_key=API_KEY)
+# Limits for executing AI-generated SQL
+AI_QUERY_TIMEOUT_SECONDS = float(os.getenv("AI_QUERY_TIMEOUT_SECONDS", "5"))
+AI_QUERY_MAX_ROWS = int(os.getenv("AI_QUERY_MAX_ROWS", "1000"))
+# Time limit for /ask/export, which streams the full result set and has no row cap
+AI_EXPORT_TIMEOUT_SECONDS = float(os.getenv("AI_EXPORT_TIMEOUT_SECONDS", "300"))
+# Largest row-combination count allowed for plans with several nested full scans
+AI_QUERY_MAX_SCAN_ROWS = int(os.getenv("AI_QUERY_MAX_SCAN_ROWS", "10000000"))
+# SQLite VM instructions between deadline checks
+AI_QUERY_PROGRESS_STEPS = 10000
 
-def get_database_schema(filename: str) -> str:
-    """Introspects the user's DB to build a context string for the AI."""
-    tables = dynamic_db.get_tables(filename)
-    schema_str = "Database Schema:\n"
-    
-    for table in tables:
-        columns = dynamic_db.get_columns(filename, table)
-        col_defs = [f"{col['name']} ({col['type']})" for col in columns]
-        schema_str += f"Table '{table}': {', '.join(col_defs)}\n"
-        
-    return schema_str
+# All LLM calls go through the gateway (concurrency/rate limits, retries, request coalescing)
+gateway = llm_gateway.create_gateway(AI_BASE_URL, API_KEY, AI_MODEL)
 
-async def generate_sql(schema: str, user_question: str) -> str:
-    """Sends the schema and question to DeepSeek to get SQL."""
+def get_schema_context(filename: str, question: str) -> str:
+    """Builds a compact schema context with only the tables relevant to the question (for large databases)."""
+    filepath = dynamic_db.get_db_path(filename)
+    with metrics.schema_seconds.time(step="pruned_context"):
+        return schema_context.build_context(filepath, dynamic_db.catalog.get(filepath), question)
+
+def _build_messages(schema: str, user_question: str) -> list:
     system_prompt = f"""
     You are an expert SQLite database assistant.
     Given the following database schema, write a SQL query to answer the user's question.
@@ -37,35 +47,201 @@ async def generate_sql(schema: str, user_question: str) -> str:
     2. Do NOT wrap the SQL in markdown formatting (like ```sql).
     3. ONLY generate SELECT statements. Never UPDATE, INSERT, or DROP.
     """
-    
-    response = await client.chat.completions.create(
-        model=AI_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_question}
-        ],
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_question}
+    ]
+
+def clean_sql(content: str) -> str:
+    """Strips whitespace and any markdown fences the model added despite the rules."""
+    raw_sql = content.strip()
+    return re.sub(r"^```sql\n|```$", "", raw_sql).strip()
+
+async def generate_sql(schema: str, user_question: str) -> str:
+    """Sends the schema and question to DeepSeek to get SQL."""
+    content = await gateway.complete(
+        messages=_build_messages(schema, user_question),
         temperature=0.1 # Low temperature for logical precision
     )
-    
-    raw_sql = response.choices[0].message.content.strip()
-    
-    # Clean up markdown if the model disobeys the rule
-    raw_sql = re.sub(r"^```sql\n|```$", "", raw_sql).strip()
-    return raw_sql
+    return clean_sql(content)
+
+async def stream_sql(schema: str, user_question: str):
+    """Yields the raw SQL text as the model produces it. Pass the joined text to clean_sql before running it."""
+    async for chunk in gateway.stream(messages=_build_messages(schema, user_question), temperature=0.1):
+        yield chunk
 
-def execute_read_only_sql(filename: str, sql: str) -> list[dict]:
-    """Safely executes the AI-generated SQL."""
+def _check_read_only(sql: str):
     if not sql.upper().strip().startswith("SELECT"):
         raise ValueError("Security Violation: AI generated a non-SELECT query.")
+
+def _plan_cost(children: dict, scans: dict, sizes: dict, node: int, worst: list) -> Tuple[int, List[str]]:
+    """
+    Estimated rows visited under one EXPLAIN QUERY PLAN node, and the tables it fully scans.
+    Full scans directly under a node run as nested loops, so their sizes multiply. Other branches
+    (compound parts, scalar and list subqueries, materialized views) run once and add their cost,
+    except correlated subqueries, which run once per row of the loop around them.
+    worst holds the largest nested-loop product seen so far as [rows, tables].
+    """
+    loop_tables = [scans[row_id] for row_id, _ in children.get(node, ()) if row_id in scans]
+    loop = 1
+    for table in loop_tables:
+        loop *= max(sizes[table], 1)
+    cost = loop if loop_tables else 0
+    tables = list(loop_tables)
+    if len(loop_tables) > 1 and loop > worst[0]:
+        worst[:] = [loop, loop_tables]
+    for row_id, detail in children.get(node, ()):
+        if row_id in scans:
+            continue
+        branch_cost, branch_tables = _plan_cost(children, scans, sizes, row_id, worst)
+        if detail.startswith("CORRELATED") and loop_tables and branch_tables:
+            branch_cost *= loop
+            if branch_cost > worst[0]:
+                worst[:] = [branch_cost, loop_tables + branch_tables]
+        cost += branch_cost
+        tables += branch_tables
+    return cost, tables
+
+def check_query_plan(conn: sqlite3.Connection, filepath: str, sql: str) -> int:
+    """
+    Runs EXPLAIN QUERY PLAN and rejects nested full scans whose combined size exceeds AI_QUERY_MAX_SCAN_ROWS.
+    Returns the estimated number of rows the full scans will visit.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    # The plan names tables by their alias, so map aliases back to table names
+    schema = dynamic_db.catalog.get(filepath, conn)
+    tables = {name.lower(): name for name in schema.tables}
+    aliases = {}
+    for match in re.finditer(r"\b(?=(\w+)\s+(?:AS\s+)?(\w+))", sql, re.IGNORECASE):
+        if match.group(1).lower() in tables:
+            aliases.setdefault(match.group(2).lower(), tables[match.group(1).lower()])
+
+    # Plan rows are (id, parent, notused, detail) and form a tree rooted at parent 0
+    children: Dict[int, list] = {}
+    scans: Dict[int, str] = {}
+    for row_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((row_id, detail))
+        match = re.match(r"SCAN (\w+)", detail)
+        if match and match.group(1) != "CONSTANT":
+            name = match.group(1).lower()
+            scans[row_id] = tables.get(name) or aliases.get(name) or match.group(1)
+    scanned = list(scans.values())
+    # Full scans filtered in WHERE are index candidates
+    index_advisor.record(filepath, sql, scanned, schema.tables)
+
+    sizes = {table: dynamic_db.estimate_row_count(conn, table) for table in set(scanned)}
+    worst = [0, []]
+    cost, _ = _plan_cost(children, scans, sizes, 0, worst)
+    if worst[0] > AI_QUERY_MAX_SCAN_ROWS:
+        raise ValueError(
+            f"Query rejected: it would scan about {worst[0]:,} row combinations "
+            f"({' x '.join(worst[1])}). Try a more specific question."
+        )
+    return cost
+
+def _set_deadline(conn: sqlite3.Connection, timeout_seconds: float, should_stop=None):
+    """Aborts the running statement once timeout_seconds have passed (or should_stop() returns True)."""
+    deadline = time.monotonic() + timeout_seconds
+    if should_stop is None:
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, AI_QUERY_PROGRESS_STEPS)
+    else:
+        conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline or should_stop() else 0, AI_QUERY_PROGRESS_STEPS)
+
+def execute_read_only_sql(filename: str, sql: str, timeout_seconds: Optional[float] = None, should_stop=None) -> dict:
+    """
+    Safely executes the AI-generated SQL.
+    Runs on a read-only connection, rejects oversized cartesian plans, stops after
+    timeout_seconds (default AI_QUERY_TIMEOUT_SECONDS) and returns at most AI_QUERY_MAX_ROWS rows.
+    Returns {'columns', 'rows', 'truncated', 'elapsed_ms', 'rows_scanned'}: rows are tuples in column order
+    (see result_dicts) and rows_scanned is estimated from the query plan.
+    """
+    _check_read_only(sql)
         
     filepath = dynamic_db.get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
+    start = time.perf_counter()
+    with sqlite_pool.connection(filepath, readonly=True) as conn, metrics.sql_seconds.time(source="ask"):
+        rows_scanned = check_query_plan(conn, filepath, sql)
+        timeout_seconds = AI_QUERY_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+        _set_deadline(conn, timeout_seconds, should_stop)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql)
+            columns = [desc[0] for desc in cursor.description or []]
+            rows = cursor.fetchmany(AI_QUERY_MAX_ROWS + 1)
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                if should_stop is not None and should_stop():
+                    raise ValueError("Query was cancelled")
+                raise ValueError(f"Query exceeded the {timeout_seconds:g}s time limit")
+            raise
+    truncated = len(rows) > AI_QUERY_MAX_ROWS
+    return {
+        "columns": columns,
+        "rows": rows[:AI_QUERY_MAX_ROWS],
+        "truncated": truncated,
+        "elapsed_ms": (time.perf_counter() - start) * 1000,
+        "rows_scanned": rows_scanned,
+    }
+
+def result_dicts(execution: dict) -> list:
+    """The rows of an execute_read_only_sql result as one dict per row."""
+    columns = execution["columns"]
+    return [dict(zip(columns, row)) for row in execution["rows"]]
+
+def iter_read_only_sql(
+    filename: str,
+    sql: str,
+    batch_size: int = dynamic_db.STREAM_BATCH_SIZE,
+    limited: bool = False,
+    info: Optional[dict] = None,
+    should_stop=None,
+    timeout_seconds: Optional[float] = None,
+):
+    """
+    Streaming variant of execute_read_only_sql.
+    Uses the same read-only connection and plan check.
+    limited=True stops after AI_QUERY_MAX_ROWS rows and defaults timeout_seconds to AI_QUERY_TIMEOUT_SECONDS.
+    Without either, the statement runs without a row cap or time limit.
+    Yields the column names first, then batches of row tuples.
+    info, if given, receives 'rows_scanned' once the plan is checked and 'truncated' when the rows run out.
+    should_stop, if given, interrupts the statement once it returns True.
+    """
+    _check_read_only(sql)
+    info = {} if info is None else info
+
+    filepath = dynamic_db.get_db_path(filename)
+    if timeout_seconds is None and limited:
+        timeout_seconds = AI_QUERY_TIMEOUT_SECONDS
+
+    def prepare(conn):
+        info["rows_scanned"] = check_query_plan(conn, filepath, sql)
+        if timeout_seconds is not None:
+            _set_deadline(conn, timeout_seconds, should_stop)
+        elif should_stop is not None:
+            conn.set_progress_handler(lambda: 1 if should_stop() else 0, AI_QUERY_PROGRESS_STEPS)
+
+    rows = dynamic_db.iter_query(filepath, sql, (), batch_size, readonly=True, prepare=prepare)
+    remaining = AI_QUERY_MAX_ROWS if limited else None
+    info["truncated"] = False
     try:
-        cursor.execute(sql)
-        results = [dict(row) for row in cursor.fetchall()]
-        return results
+        yield next(rows)
+        for batch in rows:
+            if remaining is not None:
+                if remaining == 0:
+                    info["truncated"] = True
+                    break
+                if len(batch) > remaining:
+                    batch = batch[:remaining]
+                    info["truncated"] = True
+                remaining -= len(batch)
+            yield batch
+            if info["truncated"]:
+                break
+    except sqlite3.OperationalError as e:
+        if "interrupted" in str(e):
+            if should_stop is not None and should_stop():
+                raise ValueError("Query was cancelled")
+            raise ValueError(f"Query exceeded the {timeout_seconds:g}s time limit")
+        raise
     finally:
-        conn.close()
\ No newline at end of file
+        rows.close()
@@ -0,0 +1,94 @@
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional
+
+from cache import MISSING, TTLCache
+
+# Tier 1: question -> generated SQL, keyed by (database, schema fingerprint, normalized question)
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("AI_SQL_CACHE_MAX_ENTRIES", "5000"))
+SQL_CACHE_TTL_SECONDS = float(os.getenv("AI_SQL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Optional JSON-lines file that keeps the SQL cache across restarts
+SQL_CACHE_PATH = os.getenv("AI_SQL_CACHE_PATH")
+
+# Tier 2: SQL -> query results, keyed by (database, SQL, data version)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("AI_RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("AI_RESULT_CACHE_TTL_SECONDS", "300"))
+# Larger result sets are not cached to keep memory bounded
+RESULT_CACHE_MAX_ROWS = int(os.getenv("AI_RESULT_CACHE_MAX_ROWS", "1000"))
+
+sql_cache = TTLCache(SQL_CACHE_MAX_ENTRIES, SQL_CACHE_TTL_SECONDS)
+result_cache = TTLCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL_SECONDS)
+
+_persist_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Lowercases, collapses whitespace and drops trailing punctuation so trivial variations share an entry."""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?.! ")
+
+
+def _load_persisted():
+    """Loads the SQL cache file, compacting it if it has grown well past the cache size."""
+    if not SQL_CACHE_PATH or not os.path.exists(SQL_CACHE_PATH):
+        return
+    entries: Dict[tuple, str] = {}
+    lines = 0
+    with open(SQL_CACHE_PATH, encoding="utf-8") as f:
+        for line in f:
+            lines += 1
+            try:
+                record = json.loads(line)
+                entries[tuple(record["key"])] = record["sql"]
+            except (ValueError, KeyError, TypeError):
+                continue
+    # Later lines win; keep only the most recent entries
+    for key, sql in list(entries.items())[-SQL_CACHE_MAX_ENTRIES:]:
+        sql_cache.set(key, sql)
+    if lines > 2 * SQL_CACHE_MAX_ENTRIES:
+        with _persist_lock, open(SQL_CACHE_PATH, "w", encoding="utf-8") as f:
+            for key, sql in list(entries.items())[-SQL_CACHE_MAX_ENTRIES:]:
+                f.write(json.dumps({"key": list(key), "sql": sql}) + "\n")
+
+
+def _persist(key: tuple, sql: str):
+    if not SQL_CACHE_PATH:
+        return
+    with _persist_lock, open(SQL_CACHE_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"key": list(key), "sql": sql}) + "\n")
+
+
+def get_sql(filename: str, schema_fingerprint: str, question: str) -> Optional[str]:
+    """Returns previously generated SQL for this question and schema, or None."""
+    sql = sql_cache.get((filename, schema_fingerprint, normalize_question(question)))
+    return None if sql is MISSING else sql
+
+
+def put_sql(filename: str, schema_fingerprint: str, question: str, sql: str):
+    """Stores SQL that was generated for a question and executed successfully."""
+    key = (filename, schema_fingerprint, normalize_question(question))
+    sql_cache.set(key, sql)
+    _persist(key, sql)
+
+
+def get_results(filename: str, sql: str, data_version: int) -> Optional[Dict[str, Any]]:
+    """Returns the cached execute_read_only_sql output for sql at the given data version, or None."""
+    execution = result_cache.get((filename, sql, data_version))
+    return None if execution is MISSING else execution
+
+
+def put_results(filename: str, sql: str, data_version: int, execution: Dict[str, Any]):
+    """Caches execute_read_only_sql output. Any later write changes the data version, so stale entries are never read."""
+    if len(execution["rows"]) <= RESULT_CACHE_MAX_ROWS:
+        result_cache.set((filename, sql, data_version), execution)
+
+
+def forget_database(filename: str):
+    """Drops every cached entry for a deleted database."""
+    sql_cache.discard_matching(lambda key, _: key[0] == filename)
+    result_cache.discard_matching(lambda key, _: key[0] == filename)
+
+
+_load_persisted()
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+# Threads shared by all user databases, and how many of them one database may occupy.
+# Keeping the per-database limit below the pool size means a slow database can never
+# take every worker away from other users.
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))
+DB_MAX_CONCURRENCY_PER_DATABASE = int(os.getenv("DB_MAX_CONCURRENCY_PER_DATABASE", "4"))
+
+
+class DatabaseExecutor:
+    """
+    Runs blocking dynamic_db calls on a dedicated thread pool so the event loop stays free.
+    Calls are admitted per database file through a semaphore.
+    """
+
+    def __init__(self, workers: int = DB_EXECUTOR_WORKERS, per_database: int = DB_MAX_CONCURRENCY_PER_DATABASE):
+        self.per_database = per_database
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dynamic-db")
+        self._lock = threading.Lock()
+        # filename -> [semaphore, number of callers using it]
+        self._semaphores: Dict[str, list] = {}
+
+    def _acquire_semaphore(self, filename: str) -> asyncio.Semaphore:
+        with self._lock:
+            entry = self._semaphores.get(filename)
+            if entry is None:
+                entry = [asyncio.Semaphore(self.per_database), 0]
+                self._semaphores[filename] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def _release_semaphore(self, filename: str):
+        # Forget idle databases so the table doesn't grow with every file ever used
+        with self._lock:
+            entry = self._semaphores[filename]
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._semaphores[filename]
+
+    async def run(self, filename: str, fn: Callable, *args, **kwargs) -> Any:
+        """Runs fn(*args, **kwargs) on the pool, counted against filename's concurrency limit."""
+        semaphore = self._acquire_semaphore(filename)
+        try:
+            async with semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._release_semaphore(filename)
+
+
+# Shared executor used by the request handlers
+executor = DatabaseExecutor()
+
+
+async def call(fn: Callable, filename: str, *args, **kwargs) -> Any:
+    """
+    Awaitable wrapper for dynamic_db style functions that take the database filename first.
+    Example: await async_db.call(dynamic_db.get_rows, filename, table_name)
+    """
+    return await executor.run(filename, fn, filename, *args, **kwargs)
+
+
+async def write(submit: Callable, filename: str, *args, **kwargs) -> Any:
+    """
+    Awaitable wrapper for dynamic_db submit_* functions, which queue a write on the database's
+    writer thread and return a concurrent Future. No executor thread is held while waiting,
+    so many concurrent writes can pile up and be committed as one group.
+    Example: await async_db.write(dynamic_db.submit_add_row, filename, table_name, data)
+    """
+    return await asyncio.wrap_future(submit(filename, *args, **kwargs))
@@ -1,3 +1,8 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import jwt
@@ -9,8 +14,70 @@ SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt cost factor (2^rounds iterations). Lower it only for development or load tests.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# Size of the dedicated hashing pool and how many operations may wait for it
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
 # Setup password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool already has too many operations pending."""
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool so it never blocks the event loop.
+    bcrypt releases the GIL, so the workers hash in parallel.
+    Operations beyond max_pending are rejected instead of queued.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        # Operation name -> latency counters in milliseconds
+        self._latency = {}
+
+    async def run(self, operation: str, fn, *args):
+        """Runs fn(*args) on the pool and records its latency (including queue wait) under operation."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy("Too many login attempts in progress, please retry shortly")
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._pending -= 1
+                stats = self._latency.setdefault(operation, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                stats["count"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def stats(self):
+        """Returns queue depth, rejections and per-operation latency."""
+        with self._lock:
+            latency = {
+                op: {**s, "avg_ms": s["total_ms"] / s["count"] if s["count"] else 0.0}
+                for op, s in self._latency.items()
+            }
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+                "rounds": BCRYPT_ROUNDS,
+                "latency": latency,
+            }
+
+password_hasher = PasswordHasher()
 
 def verify_password(plain_password, hashed_password):
     """
@@ -24,6 +91,20 @@ def get_password_hash(password):
     """
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password, hashed_password):
+    """
+    verify_password on the password hashing pool.
+    Raises PasswordHasherBusy when the pool is saturated.
+    """
+    return await password_hasher.run("verify", verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """
+    get_password_hash on the password hashing pool.
+    Raises PasswordHasherBusy when the pool is saturated.
+    """
+    return await password_hasher.run("hash", get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """
     Create a JWT access token.
@@ -0,0 +1,383 @@
+"""
+Load-test and benchmark harness for the backend API.
+
+Runs the FastAPI app in-process through httpx.ASGITransport (no server or network), seeds
+synthetic users and tables, and drives each scenario with a fixed number of concurrent clients.
+Reports throughput, p50/p95/p99 latency, errors and peak RSS per scenario.
+
+Examples (from the backend directory):
+    python benchmark.py --rows 100000
+    python benchmark.py --rows 1000000 --scenarios query,crud --save-baseline baseline.json
+    python benchmark.py --rows 1000000 --scenarios query,crud --baseline baseline.json
+
+Everything is created in a temporary working directory, and /ask uses the stub LLM backend.
+With --baseline the exit status is 1 if any scenario regressed by more than --tolerance.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Share of requests per scenario in the "mixed" workload
+MIXED_WEIGHTS = {"login": 2, "get_rows": 8, "query": 30, "crud": 25, "schema": 20, "ask": 15}
+SCENARIOS = ["login", "get_rows", "query", "crud", "schema", "ask", "mixed"]
+
+BIG_TABLE = "items"
+SMALL_TABLE = "lookup"
+CATEGORIES = ["books", "games", "music", "garden", "tools", "food", "toys", "sports"]
+PASSWORD = "benchmark-password"
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process; falls back to the peak on systems without /proc."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and KiB elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Samples the RSS in the background while a scenario runs and keeps the peak."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, current_rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss_bytes()
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def synthetic_rows(count: int, seed: int):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (
+            f"item-{i:08d}",
+            CATEGORIES[rng.randrange(len(CATEGORIES))],
+            round(rng.uniform(1, 500), 2),
+            rng.randrange(1, 100),
+            f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+        )
+
+
+ROW_COLUMNS = [
+    {"name": "name", "type": "TEXT"},
+    {"name": "category", "type": "TEXT"},
+    {"name": "amount", "type": "REAL"},
+    {"name": "quantity", "type": "INTEGER"},
+    {"name": "created_at", "type": "TEXT"},
+]
+
+
+class Workload:
+    """Seeded users and tables plus one request function per scenario."""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.users: List[Dict[str, Any]] = []
+        self.rng = random.Random(args.seed)
+        self.questions = itertools.cycle(
+            [f"How many {CATEGORIES[i % len(CATEGORIES)]} items were sold in batch {i}?" for i in range(args.ask_questions)]
+        )
+
+    @staticmethod
+    def _check(response, expected=(200,)):
+        if response.status_code not in expected:
+            raise RuntimeError(f"{response.request.method} {response.request.url.path} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+    async def seed(self):
+        import dynamic_db
+
+        for n in range(self.args.users):
+            username = f"bench{n}"
+            self._check(await self.client.post(
+                "/register", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD}
+            ))
+            token = (self._check(await self.client.post(
+                "/login", data={"username": username, "password": PASSWORD}
+            ))).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            database = (self._check(await self.client.post(
+                "/databases/", json={"name": f"bench {n}"}, headers=headers
+            ))).json()
+            base = f"/databases/{database['id']}"
+            for table in (BIG_TABLE, SMALL_TABLE):
+                self._check(await self.client.post(
+                    f"{base}/tables", json={"name": table, "columns": ROW_COLUMNS}, headers=headers
+                ))
+            # Seeding through the API would dominate the run; bulk-load the files directly instead
+            columns = [col["name"] for col in ROW_COLUMNS]
+            dynamic_db.insert_rows(database["filename"], BIG_TABLE, columns, synthetic_rows(self.args.rows, self.args.seed + n), 10000)
+            dynamic_db.insert_rows(database["filename"], SMALL_TABLE, columns, synthetic_rows(self.args.small_rows, self.args.seed), 10000)
+            if self.args.index:
+                dynamic_db.create_index(database["filename"], BIG_TABLE, ["category"])
+            self.users.append({"username": username, "headers": headers, "base": base, "inserted": []})
+
+    def _user(self) -> Dict[str, Any]:
+        return self.users[self.rng.randrange(len(self.users))]
+
+    async def login(self):
+        user = self._user()
+        return await self.client.post("/login", data={"username": user["username"], "password": PASSWORD})
+
+    async def get_rows(self):
+        user = self._user()
+        return await self.client.get(f"{user['base']}/tables/{SMALL_TABLE}/rows", headers=user["headers"])
+
+    async def query(self):
+        """One page of the big table: half plain keyset pages, half filtered and sorted."""
+        user = self._user()
+        if self.rng.random() < 0.5:
+            body = {"limit": 100}
+        else:
+            body = {
+                "limit": 50,
+                "order_by": "amount",
+                "descending": True,
+                "filters": [{"column": "category", "op": "eq", "value": self.rng.choice(CATEGORIES)}],
+            }
+        return await self.client.post(f"{user['base']}/tables/{BIG_TABLE}/rows/query", json=body, headers=user["headers"])
+
+    async def crud(self):
+        """Inserts a row, or updates or deletes one inserted earlier by this workload."""
+        user = self._user()
+        inserted = user["inserted"]
+        url = f"{user['base']}/tables/{BIG_TABLE}/rows"
+        choice = self.rng.random()
+        if not inserted or choice < 0.5:
+            row = next(synthetic_rows(1, self.rng.randrange(1 << 30)))
+            response = await self.client.post(url, json={"data": dict(zip([c["name"] for c in ROW_COLUMNS], row))}, headers=user["headers"])
+            if response.status_code == 200:
+                inserted.append(response.json()["id"])
+            return response
+        if choice < 0.8:
+            row_id = self.rng.choice(inserted)
+            return await self.client.put(f"{url}/{row_id}", json={"data": {"quantity": self.rng.randrange(100)}}, headers=user["headers"])
+        row_id = inserted.pop(self.rng.randrange(len(inserted)))
+        return await self.client.delete(f"{url}/{row_id}", headers=user["headers"])
+
+    async def schema(self):
+        user = self._user()
+        if self.rng.random() < 0.5:
+            return await self.client.get(f"{user['base']}/tables", headers=user["headers"])
+        return await self.client.get(f"{user['base']}/tables/{BIG_TABLE}/columns", headers=user["headers"])
+
+    async def ask(self):
+        user = self._user()
+        response = await self.client.post(f"{user['base']}/ask", json={"question": next(self.questions)}, headers=user["headers"])
+        # /ask reports failures in the body with status 200
+        if response.status_code == 200 and response.json().get("error"):
+            response.status_code = 599
+        return response
+
+    async def mixed(self):
+        names = list(MIXED_WEIGHTS)
+        name = self.rng.choices(names, weights=[MIXED_WEIGHTS[n] for n in names])[0]
+        return await getattr(self, name)()
+
+
+async def run_scenario(request: Callable, total: int, concurrency: int) -> Dict[str, Any]:
+    """Sends total requests from concurrency clients and summarizes their latencies."""
+    latencies: List[float] = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def client_loop():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await request()
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Lists the scenarios whose throughput dropped or p95/p99 latency rose by more than tolerance."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        for key in ("p95_ms", "p99_ms"):
+            if result[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {before[key]} -> {result[key]}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]]):
+    header = f"{'scenario':<10} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(f"{name:<10} {r['requests']:>8} {r['errors']:>6} {r['throughput_rps']:>9} "
+              f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mb']:>8}")
+        before = (baseline or {}).get("scenarios", {}).get(name)
+        if before:
+            print(f"{'  baseline':<10} {'':>8} {'':>6} {before['throughput_rps']:>9} "
+                  f"{before['p50_ms']:>9} {before['p95_ms']:>9} {before['p99_ms']:>9} {before['peak_rss_mb']:>8}")
+
+
+async def main(args) -> int:
+    import httpx
+    import main as app_module
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})", file=sys.stderr)
+        return 2
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config", {}).get("rows") != args.rows:
+            print(f"Warning: baseline was recorded with {baseline.get('config', {}).get('rows')} rows, this run uses {args.rows}", file=sys.stderr)
+
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with app_module.lifespan(app_module.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            workload = Workload(client, args)
+            started = time.perf_counter()
+            await workload.seed()
+            print(f"Seeded {args.users} users x {args.rows} rows in {time.perf_counter() - started:.1f}s "
+                  f"(RSS {current_rss_bytes() / (1024 * 1024):.0f} MB)", file=sys.stderr)
+
+            results = {}
+            for name in scenarios:
+                if args.warmup:
+                    await run_scenario(getattr(workload, name), args.warmup, args.concurrency)
+                results[name] = await run_scenario(getattr(workload, name), args.requests, args.concurrency)
+                print(f"  {name}: {results[name]['throughput_rps']} req/s", file=sys.stderr)
+
+    report = {
+        "config": {
+            "rows": args.rows,
+            "small_rows": args.small_rows,
+            "users": args.users,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "index": args.index,
+            "llm_stub_latency_seconds": float(os.environ["LLM_STUB_LATENCY_SECONDS"]),
+            "llm_rate_per_second": app_module.ai_agent.llm_gateway.LLM_RATE_PER_SECOND,
+            "bcrypt_rounds": app_module.auth.BCRYPT_ROUNDS,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "scenarios": results,
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.save_baseline}", file=sys.stderr)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the backend API in-process.")
+    parser.add_argument("--rows", type=int, default=10000, help="rows seeded into the big table per user (10k-10M)")
+    parser.add_argument("--small-rows", type=int, default=1000, help="rows in the small table read whole by get_rows")
+    parser.add_argument("--users", type=int, default=4, help="synthetic users, each with one database")
+    parser.add_argument("--requests", type=int, default=500, help="requests measured per scenario")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests sent before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--ask-questions", type=int, default=50, help="distinct /ask questions cycled through")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--llm-rate", type=float, help="LLM gateway rate limit in calls/s (default: LLM_RATE_PER_SECOND)")
+    parser.add_argument("--bcrypt-rounds", type=int, help="bcrypt cost for seeded users (default: BCRYPT_ROUNDS)")
+    parser.add_argument("--index", action="store_true", help="index the filtered column of the big table")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for data and request mix")
+    parser.add_argument("--workdir", help="directory for users.db and user_databases (default: a new temp dir)")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--save-baseline", help="write this run's report to a JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression against the baseline")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON instead of a table")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    for path in ("baseline", "save_baseline"):
+        if getattr(args, path):
+            setattr(args, path, os.path.abspath(getattr(args, path)))
+    # The app keeps users.db and user_databases/ relative to the working directory
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="benchmark-"))
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ["AI_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_SECONDS"] = str(args.llm_latency)
+    if args.llm_rate is not None:
+        os.environ["LLM_RATE_PER_SECOND"] = str(args.llm_rate)
+        os.environ["LLM_RATE_BURST"] = str(max(1, int(args.llm_rate)))
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("AGENT_API_KEY", "benchmark")
+    sys.exit(asyncio.run(main(args)))
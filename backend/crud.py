@@ -1,7 +1,13 @@
+from typing import Optional
 from sqlalchemy.orm import Session
 import models, schemas, auth
 import uuid
 import dynamic_db
+import ai_cache
+import index_advisor
+import shared_state
+import table_stats
+from cache import MISSING, token_cache, ownership_cache
 
 def get_user_by_username(db: Session, username: str):
     """
@@ -15,26 +21,45 @@ def get_user_by_email(db: Session, email: str):
     """
     return db.query(models.User).filter(models.User.email == email).first()
 
-def create_user(db: Session, user: schemas.UserCreate):
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: Optional[str] = None):
     """
     Create a new user in the database.
-    1. Hash the password.
+    1. Hash the password (unless the caller already hashed it).
     2. Create a User model instance.
     3. Add to the session and commit.
     4. Refresh to get the ID and defaults.
     """
-    hashed_password = auth.get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(user.password)
     db_user = models.User(email=user.email, username=user.username, hashed_password=hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    invalidate_user(db_user.username)
     return db_user
 
-def get_databases(db: Session, user_id: int, skip: int = 0, limit: int = 100):
+def invalidate_user(username: str):
     """
-    Retrieve all databases for a specific user.
+    Drop cached token lookups for a user.
+    Call after any change to the user's record.
     """
-    return db.query(models.Database).filter(models.Database.owner_id == user_id).offset(skip).limit(limit).all()
+    token_cache.discard_matching(lambda _, user: user.username == username)
+
+def get_databases(db: Session, user_id: int, skip: int = 0, limit: int = 100, after_id: Optional[int] = None):
+    """
+    Retrieve a user's databases in id order.
+    Pass the last id of the previous page as after_id to page with an (owner_id, id) index seek instead of an offset.
+    """
+    query = db.query(models.Database).filter(models.Database.owner_id == user_id)
+    if after_id is not None:
+        query = query.filter(models.Database.id > after_id)
+    return query.order_by(models.Database.id).offset(skip).limit(limit).all()
+
+def count_databases(db: Session, user_id: int) -> int:
+    """
+    Number of databases owned by a user (answered from the (owner_id, id) index).
+    """
+    return db.query(models.Database.id).filter(models.Database.owner_id == user_id).count()
 
 def get_database(db: Session, database_id: int, user_id: int):
     """
@@ -42,6 +67,24 @@ def get_database(db: Session, database_id: int, user_id: int):
     """
     return db.query(models.Database).filter(models.Database.id == database_id, models.Database.owner_id == user_id).first()
 
+def get_owned_database(db: Session, database_id: int, user_id: int):
+    """
+    Cached variant of get_database for request handlers.
+    Returns a schemas.Database snapshot, or None if the database does not belong to the user.
+    """
+    key = (user_id, database_id)
+    # A delete in any worker process bumps the epoch, which retires every cached entry
+    epoch = shared_state.counters.get("database_deletes")
+    cached = ownership_cache.get(key)
+    if cached is not MISSING and cached[0] == epoch:
+        return cached[1]
+    db_database = get_database(db, database_id, user_id)
+    if db_database is None:
+        return None
+    snapshot = schemas.Database.model_validate(db_database)
+    ownership_cache.set(key, (epoch, snapshot))
+    return snapshot
+
 def create_database(db: Session, database: schemas.DatabaseCreate, user_id: int):
     """
     Create a new database for a user.
@@ -54,6 +97,8 @@ def create_database(db: Session, database: schemas.DatabaseCreate, user_id: int)
     db.add(db_database)
     db.commit()
     db.refresh(db_database)
+    # SQLite may reuse the id of a deleted database
+    ownership_cache.discard((user_id, db_database.id))
     
     # Create the physical file
     dynamic_db.create_db_file(filename)
@@ -71,5 +116,56 @@ def delete_database(db: Session, database_id: int, user_id: int):
         
         db.delete(db_database)
         db.commit()
+        ownership_cache.discard((user_id, database_id))
+        shared_state.counters.incr("database_deletes")
+        ai_cache.forget_database(db_database.filename)
+        index_advisor.forget_database(db_database.filename)
+        table_stats.forget_database(db_database.filename)
         return True
     return False
+
+def create_job(db: Session, user_id: int, database_id: int, kind: str, params: dict, input_path: Optional[str] = None):
+    """
+    Record a new queued job.
+    """
+    db_job = models.Job(owner_id=user_id, database_id=database_id, kind=kind, params=params, progress={}, input_path=input_path)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db: Session, job_id: int, user_id: int):
+    """
+    Retrieve a job by ID and ensure it belongs to the user.
+    """
+    return db.query(models.Job).filter(models.Job.id == job_id, models.Job.owner_id == user_id).first()
+
+def get_jobs(db: Session, user_id: int, status: Optional[str] = None, skip: int = 0, limit: int = 100):
+    """
+    Retrieve a user's jobs, newest first.
+    """
+    query = db.query(models.Job).filter(models.Job.owner_id == user_id)
+    if status is not None:
+        query = query.filter(models.Job.status == status)
+    return query.order_by(models.Job.id.desc()).offset(skip).limit(limit).all()
+
+def count_unfinished_jobs(db: Session, user_id: int) -> int:
+    """
+    Number of queued or running jobs of a user.
+    """
+    return db.query(models.Job).filter(
+        models.Job.owner_id == user_id, models.Job.status.in_(["queued", "running"])
+    ).count()
+
+def get_unfinished_jobs(db: Session):
+    """
+    All queued or running jobs, oldest first (used to recover after a restart).
+    """
+    return db.query(models.Job).filter(models.Job.status.in_(["queued", "running"])).order_by(models.Job.id).all()
+
+def delete_job(db: Session, db_job: models.Job):
+    """
+    Delete a job record.
+    """
+    db.delete(db_job)
+    db.commit()
@@ -1,16 +1,56 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-# Database URL for SQLite.
-SQLALCHEMY_DATABASE_URL = "sqlite:///./users.db"
+# Database URL for the metadata store (users, databases, jobs).
+# Defaults to SQLite; set DATABASE_URL (e.g. postgresql://...) to share it between several workers.
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./users.db")
+
+# Connection pool sizing. Handlers hold a connection only while they query,
+# so the pool should roughly match the number of concurrent requests.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+
+# SQLite tuning applied to every new connection
+METADATA_BUSY_TIMEOUT_MS = int(os.getenv("METADATA_BUSY_TIMEOUT_MS", "5000"))
+METADATA_CACHE_SIZE_KIB = int(os.getenv("METADATA_CACHE_SIZE_KIB", "4096"))
+
+is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+if is_sqlite:
+    # check_same_thread=False is required for SQLite to allow multiple threads to access the database.
+    connect_args = {"check_same_thread": False, "timeout": METADATA_BUSY_TIMEOUT_MS / 1000}
+else:
+    connect_args = {}
 
 # Create the SQLAlchemy engine to interact with the database
-# connect_args={"check_same_thread": False} is required for SQLite to allow multiple threads to access the database.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+    # Server databases may drop idle connections; SQLite files never do
+    pool_pre_ping=not is_sqlite,
 )
 
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _configure_sqlite(dbapi_connection, connection_record):
+        """
+        WAL lets readers run while a registration or job update commits, busy_timeout makes
+        writers wait for the lock instead of failing, and synchronous=NORMAL is safe under WAL.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL;")
+        cursor.execute(f"PRAGMA busy_timeout={METADATA_BUSY_TIMEOUT_MS};")
+        cursor.execute("PRAGMA synchronous=NORMAL;")
+        cursor.execute(f"PRAGMA cache_size=-{METADATA_CACHE_SIZE_KIB};")
+        cursor.close()
+
 # Create a session factory for managing database sessions
 # autocommit=False: We manually commit changes
 # autoflush=False: We manually flush changes to the DB
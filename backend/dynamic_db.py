@@ -1,9 +1,40 @@
 import sqlite3
 import os
-from typing import List, Dict, Any
+import json
+import base64
+from concurrent.futures import Future
+from contextlib import contextmanager, nullcontext
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union
+
+import metrics
+import sqlite_pool
+import schema_catalog
+import schema_context
+import shared_state
+import write_queue
 
 USER_DB_DIR = "user_databases"
 
+# Upper bound for a single page returned by query_rows
+MAX_PAGE_SIZE = 1000
+# Upper bound for the number of values in an 'in' filter
+MAX_IN_VALUES = 500
+# Number of rows fetched per batch when streaming
+STREAM_BATCH_SIZE = 1000
+# Default and maximum number of operations committed per transaction by apply_row_batch
+BATCH_CHUNK_SIZE = 500
+MAX_BATCH_CHUNK_SIZE = 10000
+
+# Hidden table recording per-table options. Tables without an entry were created
+# before stable ids existed and keep renumbering ids on delete.
+TABLE_OPTIONS_TABLE = "__table_options"
+
+# Cached table/column metadata for all user databases
+catalog = schema_catalog.SchemaCatalog(hidden_tables=[TABLE_OPTIONS_TABLE])
+
+# Comparison filter operators and their SQL equivalents
+FILTER_OPERATORS = {"eq": "=", "ne": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+
 def get_db_path(filename: str) -> str:
     """Returns the full path to the user's database file."""
     # Ensure the user databases directory exists
@@ -15,37 +46,59 @@ def get_db_path(filename: str) -> str:
 def create_db_file(filename: str):
     """Creates an empty SQLite database file."""
     filepath = get_db_path(filename)
-    # Just connecting creates the file
-    conn = sqlite3.connect(filepath)
-    conn.close()
+    # Just connecting creates the file (and switches it to WAL mode)
+    with sqlite_pool.connection(filepath):
+        pass
 
 def delete_db_file(filename: str):
     """Deletes the SQLite database file."""
     filepath = get_db_path(filename)
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    # Close pooled handles first so nothing keeps writing to the removed file
+    sqlite_pool.invalidate(filepath)
+    _mark_changed(filepath, schema=True)
+    schema_context.forget_database(filepath)
+    # WAL mode keeps -wal and -shm files next to the database
+    for path in (filepath, f"{filepath}-wal", f"{filepath}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    shared_state.remove_process_lock(filepath)
+
+def _table_columns(conn: sqlite3.Connection, filepath: str, table_name: str) -> List[Dict[str, Any]]:
+    """Returns the cached columns of a table, or an empty list if it does not exist."""
+    return catalog.get(filepath, conn).tables.get(table_name, [])
+
+def _mark_changed(filepath: str, schema: bool = False):
+    """Records a committed write (and drops the cached schema after DDL)."""
+    if schema:
+        catalog.invalidate(filepath)
+    # The per-file counter invalidates result caches; it lives in shared_state so every worker sees it
+    shared_state.counters.incr(f"data:{filepath}")
+
+# One writer thread per database file; single-row writes are group-committed through it
+writers = write_queue.WriterPool(after_commit=_mark_changed)
+
+def get_data_version(filename: str) -> int:
+    """Returns a counter that changes whenever data or schema in the database changes."""
+    return shared_state.counters.get(f"data:{get_db_path(filename)}")
+
+def get_schema(filename: str) -> schema_catalog.SchemaSnapshot:
+    """Returns the cached schema (every table with its columns) of the database."""
+    return catalog.get(get_db_path(filename))
 
 def get_tables(filename: str) -> List[str]:
     """Returns a list of table names in the database."""
-    filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return tables
+    return list(get_schema(filename).tables)
 
-def create_table(filename: str, table_name: str, columns: List[Dict[str, str]]):
+def create_table(filename: str, table_name: str, columns: List[Dict[str, str]], stable_ids: bool = True):
     """
     Creates a new table.
     columns: List of dicts with 'name' and 'type'.
+    stable_ids: keep ids unchanged on delete instead of renumbering the following rows.
     """
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
     
     # Basic sanitization for table name (alphanumeric + underscore)
-    if not table_name.isidentifier():
+    if not table_name.isidentifier() or table_name == TABLE_OPTIONS_TABLE:
         raise ValueError("Invalid table name")
 
     col_defs = []
@@ -65,42 +118,44 @@ def create_table(filename: str, table_name: str, columns: List[Dict[str, str]]):
     col_defs.insert(0, "id INTEGER PRIMARY KEY AUTOINCREMENT")
     
     create_stmt = f"CREATE TABLE {table_name} ({', '.join(col_defs)});"
-    cursor.execute(create_stmt)
-    conn.commit()
-    conn.close()
+    with sqlite_pool.connection(filepath) as conn:
+        # Create the table and record its options atomically
+        conn.execute("BEGIN;")
+        conn.execute(create_stmt)
+        _set_renumber_ids(conn.cursor(), table_name, not stable_ids)
+        conn.commit()
+    _mark_changed(filepath, schema=True)
 
 def drop_table(filename: str, table_name: str):
     """Drops a table."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
-    if not table_name.isidentifier():
+    if not table_name.isidentifier() or table_name == TABLE_OPTIONS_TABLE:
         raise ValueError("Invalid table name")
-    cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
-    conn.commit()
-    conn.close()
+    with sqlite_pool.connection(filepath) as conn:
+        conn.execute("BEGIN;")
+        conn.execute(f"DROP TABLE IF EXISTS {table_name};")
+        try:
+            conn.execute(f"DELETE FROM {TABLE_OPTIONS_TABLE} WHERE table_name = ?;", (table_name,))
+        except sqlite3.OperationalError:
+            # No options table yet
+            pass
+        conn.commit()
+    _mark_changed(filepath, schema=True)
+    # Discard pooled handles that may still hold statements prepared against the table
+    sqlite_pool.invalidate(filepath)
 
 def get_columns(filename: str, table_name: str) -> List[Dict[str, str]]:
     """Returns columns of a table."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
     if not table_name.isidentifier():
         raise ValueError("Invalid table name")
     
-    # PRAGMA table_info returns: cid, name, type, notnull, dflt_value, pk
-    cursor.execute(f"PRAGMA table_info({table_name});")
-    columns = []
-    for col in cursor.fetchall():
-        columns.append({"name": col[1], "type": col[2], "pk": bool(col[5])})
-    conn.close()
-    return columns
+    columns = get_schema(filename).tables.get(table_name, [])
+    return [dict(col) for col in columns]
 
 def add_column(filename: str, table_name: str, column_name: str, column_type: str):
     """Adds a column to a table."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
     
     if not table_name.isidentifier() or not column_name.isidentifier():
         raise ValueError("Invalid names")
@@ -108,76 +163,179 @@ def add_column(filename: str, table_name: str, column_name: str, column_type: st
     if column_type.upper() not in ['TEXT', 'INTEGER', 'REAL', 'BLOB', 'NULL']:
          column_type = 'TEXT'
 
-    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type};")
-    conn.commit()
-    conn.close()
+    with sqlite_pool.connection(filepath) as conn:
+        conn.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type};")
+        conn.commit()
+    _mark_changed(filepath, schema=True)
 
 def drop_column(filename: str, table_name: str, column_name: str):
     """Drops a column from a table."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
     
     if not table_name.isidentifier() or not column_name.isidentifier():
         raise ValueError("Invalid names")
         
     # SQLite support for DROP COLUMN varies, but assuming modern version
+    with sqlite_pool.connection(filepath) as conn:
+        try:
+            conn.execute(f"ALTER TABLE {table_name} DROP COLUMN {column_name};")
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Could not drop column (SQLite version might be old): {e}")
+    _mark_changed(filepath, schema=True)
+
+def estimate_row_count(conn: sqlite3.Connection, table_name: str) -> int:
+    """Cheap row-count estimate: MAX(rowid) is a single index lookup. 0 if the table does not exist."""
     try:
-        cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {column_name};")
+        return conn.execute(f'SELECT MAX(rowid) FROM "{table_name}";').fetchone()[0] or 0
+    except sqlite3.Error:
+        return 0
+
+def _index_columns(conn: sqlite3.Connection, index_name: str) -> List[str]:
+    return [row[2] for row in conn.execute("SELECT * FROM pragma_index_info(?) ORDER BY seqno;", (index_name,)).fetchall()]
+
+def get_indexes(filename: str, table_name: str) -> List[Dict[str, Any]]:
+    """Returns the indexes created on a table (not the automatic ones SQLite adds for constraints)."""
+    filepath = get_db_path(filename)
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+
+    with sqlite_pool.connection(filepath) as conn:
+        if not _table_columns(conn, filepath, table_name):
+            raise ValueError(f"Table '{table_name}' not found")
+        indexes = []
+        for _, name, unique, origin, _ in conn.execute("SELECT * FROM pragma_index_list(?);", (table_name,)).fetchall():
+            if origin != "c":
+                continue
+            indexes.append({"name": name, "columns": _index_columns(conn, name), "unique": bool(unique)})
+    return sorted(indexes, key=lambda index: index["name"])
+
+def create_index(filename: str, table_name: str, columns: List[str], unique: bool = False, index_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Creates a single- or multi-column index on a table.
+    index_name defaults to idx_<table>_<columns>.
+    """
+    filepath = get_db_path(filename)
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    if not columns:
+        raise ValueError("An index needs at least one column")
+    if len(set(columns)) != len(columns):
+        raise ValueError("Index columns must be unique")
+    for column in columns:
+        if not column.isidentifier():
+            raise ValueError(f"Invalid column name: {column}")
+    index_name = index_name or f"idx_{table_name}_{'_'.join(columns)}"
+    if not index_name.isidentifier() or index_name.lower().startswith("sqlite_"):
+        raise ValueError("Invalid index name")
+
+    with sqlite_pool.connection(filepath) as conn:
+        valid_columns = {col["name"] for col in _table_columns(conn, filepath, table_name)}
+        if not valid_columns:
+            raise ValueError(f"Table '{table_name}' not found")
+        for column in columns:
+            if column not in valid_columns:
+                raise ValueError(f"Column '{column}' not found")
+        try:
+            conn.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX {index_name} ON {table_name} ({', '.join(columns)});"
+            )
+            conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError("Cannot create a unique index: the table contains duplicate values")
+        except sqlite3.OperationalError as e:
+            if "already exists" in str(e):
+                raise ValueError(f"Index '{index_name}' already exists")
+            raise
+    _mark_changed(filepath, schema=True)
+    return {"name": index_name, "columns": list(columns), "unique": unique}
+
+def drop_index(filename: str, table_name: str, index_name: str):
+    """Drops an index of a table."""
+    filepath = get_db_path(filename)
+    if not table_name.isidentifier() or not index_name.isidentifier():
+        raise ValueError("Invalid names")
+
+    with sqlite_pool.connection(filepath) as conn:
+        found = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ? AND tbl_name = ? AND sql IS NOT NULL;",
+            (index_name, table_name),
+        ).fetchone()
+        if found is None:
+            raise ValueError(f"Index '{index_name}' not found")
+        conn.execute(f"DROP INDEX {index_name};")
         conn.commit()
-    except sqlite3.OperationalError as e:
-        conn.close()
-        raise ValueError(f"Could not drop column (SQLite version might be old): {e}")
-    
-    conn.close()
+    _mark_changed(filepath, schema=True)
 
-def get_rows(filename: str, table_name: str) -> List[Dict[str, Any]]:
-    """Returns all rows from a table."""
+def vacuum(filename: str, should_stop=None) -> Dict[str, int]:
+    """
+    Rebuilds the database file to reclaim free pages.
+    should_stop() is polled while VACUUM runs; returning True aborts it.
+    Returns the size of the database and its WAL before and after.
+    """
+    filepath = get_db_path(filename)
+
+    def size() -> int:
+        return sum(os.path.getsize(path) for path in (filepath, f"{filepath}-wal") if os.path.exists(path))
+
+    size_before = size()
+    with sqlite_pool.connection(filepath) as conn:
+        if should_stop is not None:
+            conn.set_progress_handler(lambda: 1 if should_stop() else 0, 10000)
+        try:
+            conn.execute("VACUUM;")
+        except sqlite3.OperationalError as e:
+            if "interrupted" in str(e):
+                raise ValueError("VACUUM was interrupted")
+            raise
+        # Move the rebuilt pages from the WAL back into the database file
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    _mark_changed(filepath)
+    return {"bytes_before": size_before, "bytes_after": size()}
+
+def get_rows(filename: str, table_name: str, row_numbers: bool = False, columnar: bool = False) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Returns all rows from a table.
+    row_numbers: add a consecutive 'row_number' to each row for display, since ids may have gaps
+    (named '__row_number' instead if the table has its own 'row_number' column).
+    columnar: return {'columns': [...], 'rows': [tuple, ...]} instead of one dict per row.
+    """
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    # Return rows as dicts
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
     
     if not table_name.isidentifier():
         raise ValueError("Invalid table name")
         
-    try:
-        cursor.execute(f"SELECT * FROM {table_name};")
-        rows = [dict(row) for row in cursor.fetchall()]
-    except sqlite3.OperationalError as e:
-        conn.close()
-        if "no such table" in str(e):
-             raise ValueError(f"Table '{table_name}' not found")
-        raise e
+    with sqlite_pool.connection(filepath) as conn, metrics.sql_seconds.time(source="rows"):
+        cursor = conn.cursor()
+        try:
+            if row_numbers:
+                # Aliased so it can't be confused with a user column of the same name
+                cursor.execute(f"SELECT ROW_NUMBER() OVER (ORDER BY id) AS __row_number, * FROM {table_name} ORDER BY id;")
+            else:
+                cursor.execute(f"SELECT * FROM {table_name};")
+            columns = [desc[0] for desc in cursor.description]
+            if row_numbers and "row_number" not in columns[1:]:
+                columns[0] = "row_number"
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                 raise ValueError(f"Table '{table_name}' not found")
+            raise e
         
-    conn.close()
-    return rows
+    if columnar:
+        return {"columns": columns, "rows": rows}
+    return [dict(zip(columns, row)) for row in rows]
 
-def add_row(filename: str, table_name: str, data: Dict[str, Any]):
-    """Adds a row to a table."""
-    filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
+def _insert_row(conn: sqlite3.Connection, filepath: str, table_name: str, data: Dict[str, Any]) -> int:
     cursor = conn.cursor()
-    
-    if not table_name.isidentifier():
-        raise ValueError("Invalid table name")
-    
+
     # Filter data to only valid columns
-    try:
-        cursor.execute(f"PRAGMA table_info({table_name});")
-    except sqlite3.OperationalError as e:
-        conn.close()
-        raise e # PRAGMA shouldn't fail even if table missing (returns empty), but just in case
-        
-    # Check if table exists by seeing if we got any columns (or check master)
-    # PRAGMA table_info returns empty list if table doesn't exist
-    columns_info = cursor.fetchall()
+    # Check if table exists by seeing if we got any columns
+    columns_info = _table_columns(conn, filepath, table_name)
     if not columns_info:
-         conn.close()
          raise ValueError(f"Table '{table_name}' not found")
 
-    valid_columns = {row[1] for row in columns_info}
+    valid_columns = {col["name"] for col in columns_info}
     
     filtered_data = {k: v for k, v in data.items() if k in valid_columns and k != 'id'}
     
@@ -197,65 +355,124 @@ def add_row(filename: str, table_name: str, data: Dict[str, Any]):
     else:
         query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(placeholders)});"
         cursor.execute(query, values)
-        
-    conn.commit()
-    row_id = cursor.lastrowid
-    conn.close()
-    return row_id
+    return cursor.lastrowid
 
-def delete_row(filename: str, table_name: str, row_id: int):
-    """Deletes a row by ID and renumbers the remaining rows to keep IDs consecutive."""
+def submit_add_row(filename: str, table_name: str, data: Dict[str, Any]) -> Future:
+    """Queues a row insert on the database's writer. The future resolves to the new row id."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
     
     if not table_name.isidentifier():
         raise ValueError("Invalid table name")
-        
+    
+    return writers.submit(filepath, lambda conn: _insert_row(conn, filepath, table_name, data))
+
+def add_row(filename: str, table_name: str, data: Dict[str, Any]):
+    """Adds a row to a table."""
+    return submit_add_row(filename, table_name, data).result()
+
+def _set_renumber_ids(cursor: sqlite3.Cursor, table_name: str, renumber_ids: bool):
+    """Records whether deletes on a table renumber the following ids."""
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLE_OPTIONS_TABLE} (table_name TEXT PRIMARY KEY, renumber_ids INTEGER NOT NULL);"
+    )
+    cursor.execute(
+        f"INSERT OR REPLACE INTO {TABLE_OPTIONS_TABLE} (table_name, renumber_ids) VALUES (?, ?);",
+        (table_name, int(renumber_ids)),
+    )
+
+def _renumbers_ids(cursor: sqlite3.Cursor, table_name: str) -> bool:
+    """Returns True if deletes on the table renumber ids (tables created before stable ids)."""
     try:
-        cursor.execute(f"DELETE FROM {table_name} WHERE id = ?;", (row_id,))
-        
-        # Renumber the remaining rows to keep IDs consecutive
-        cursor.execute(f"UPDATE {table_name} SET id = id - 1 WHERE id > ?;", (row_id,))
-        
-        # Reset the AUTOINCREMENT sequence to the new max ID
-        cursor.execute(f"SELECT MAX(id) FROM {table_name};")
-        max_id = cursor.fetchone()[0]
-        if max_id is not None:
-            cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?;", (max_id, table_name))
-        
+        cursor.execute(f"SELECT renumber_ids FROM {TABLE_OPTIONS_TABLE} WHERE table_name = ?;", (table_name,))
+    except sqlite3.OperationalError:
+        return True
+    row = cursor.fetchone()
+    return row is None or bool(row[0])
+
+def get_table_options(filename: str, table_name: str) -> Dict[str, Any]:
+    """Returns the options of a table."""
+    filepath = get_db_path(filename)
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    with sqlite_pool.connection(filepath) as conn:
+        cursor = conn.cursor()
+        if not _table_columns(conn, filepath, table_name):
+            raise ValueError(f"Table '{table_name}' not found")
+        return {"stable_ids": not _renumbers_ids(cursor, table_name)}
+
+def set_stable_ids(filename: str, table_name: str, stable_ids: bool):
+    """
+    Switches a table between stable ids and renumbering on delete.
+    Switching back to renumbering does not close gaps left by earlier deletes.
+    """
+    filepath = get_db_path(filename)
+    if not table_name.isidentifier() or table_name == TABLE_OPTIONS_TABLE:
+        raise ValueError("Invalid table name")
+    with sqlite_pool.connection(filepath) as conn:
+        cursor = conn.cursor()
+        if not _table_columns(conn, filepath, table_name):
+            raise ValueError(f"Table '{table_name}' not found")
+        conn.execute("BEGIN;")
+        _set_renumber_ids(cursor, table_name, not stable_ids)
         conn.commit()
+
+def _delete_and_renumber(cursor: sqlite3.Cursor, table_name: str, row_id: int):
+    """Deletes a row and shifts the following IDs down by one to keep them consecutive."""
+    cursor.execute(f"DELETE FROM {table_name} WHERE id = ?;", (row_id,))
+    
+    # Renumber the remaining rows to keep IDs consecutive
+    cursor.execute(f"UPDATE {table_name} SET id = id - 1 WHERE id > ?;", (row_id,))
+
+def _reset_sequence(cursor: sqlite3.Cursor, table_name: str):
+    """Resets the AUTOINCREMENT sequence to the current max ID."""
+    cursor.execute(f"SELECT MAX(id) FROM {table_name};")
+    max_id = cursor.fetchone()[0]
+    if max_id is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?;", (max_id, table_name))
+
+def _delete_row(conn: sqlite3.Connection, table_name: str, row_id: int):
+    cursor = conn.cursor()
+    try:
+        if _renumbers_ids(cursor, table_name):
+            _delete_and_renumber(cursor, table_name, row_id)
+            _reset_sequence(cursor, table_name)
+        else:
+            cursor.execute(f"DELETE FROM {table_name} WHERE id = ?;", (row_id,))
     except sqlite3.OperationalError as e:
-        conn.close()
         if "no such table" in str(e):
              raise ValueError(f"Table '{table_name}' not found")
         raise e
-        
-    conn.close()
 
-def update_row(filename: str, table_name: str, row_id: int, data: Dict[str, Any]):
-    """Updates a row."""
+def submit_delete_row(filename: str, table_name: str, row_id: int) -> Future:
+    """Queues a row delete on the database's writer."""
     filepath = get_db_path(filename)
-    conn = sqlite3.connect(filepath)
-    cursor = conn.cursor()
-
+    
     if not table_name.isidentifier():
         raise ValueError("Invalid table name")
 
+    return writers.submit(filepath, lambda conn: _delete_row(conn, table_name, row_id))
+
+def delete_row(filename: str, table_name: str, row_id: int):
+    """
+    Deletes a row by ID.
+    Tables created before stable ids also renumber the remaining rows to keep IDs consecutive.
+    """
+    submit_delete_row(filename, table_name, row_id).result()
+
+def _update_row(conn: sqlite3.Connection, filepath: str, table_name: str, row_id: int, data: Dict[str, Any]):
+    cursor = conn.cursor()
+
     # Filter data to only valid columns
-    cursor.execute(f"PRAGMA table_info({table_name});")
-    columns_info = cursor.fetchall()
+    columns_info = _table_columns(conn, filepath, table_name)
     if not columns_info:
-         conn.close()
          raise ValueError(f"Table '{table_name}' not found")
 
-    valid_columns = {row[1] for row in columns_info}
+    valid_columns = {col["name"] for col in columns_info}
     
     filtered_data = {k: v for k, v in data.items() if k in valid_columns and k != 'id'}
     
     if not filtered_data:
          # Nothing to update
-         conn.close()
          return
 
     set_clauses = []
@@ -267,5 +484,531 @@ def update_row(filename: str, table_name: str, row_id: int, data: Dict[str, Any]
     values.append(row_id)
     query = f"UPDATE {table_name} SET {', '.join(set_clauses)} WHERE id = ?;"
     cursor.execute(query, values)
+
+def submit_update_row(filename: str, table_name: str, row_id: int, data: Dict[str, Any]) -> Future:
+    """Queues a row update on the database's writer."""
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+
+    return writers.submit(filepath, lambda conn: _update_row(conn, filepath, table_name, row_id, data))
+
+def update_row(filename: str, table_name: str, row_id: int, data: Dict[str, Any]):
+    """Updates a row."""
+    submit_update_row(filename, table_name, row_id, data).result()
+
+def _encode_cursor(order_by: str, descending: bool, last_row: List[Any]) -> str:
+    """Encodes the sort key of the last row of a page as an opaque token."""
+    payload = {"o": order_by, "d": descending, "k": last_row}
+    try:
+        raw = json.dumps(payload, separators=(",", ":"))
+    except TypeError:
+        raise ValueError(f"Cannot paginate on binary values in column '{order_by}'")
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(token: str, order_by: str, descending: bool) -> List[Any]:
+    """Decodes a token produced by _encode_cursor and checks it matches the query."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        key = payload["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get("o") != order_by or payload.get("d") != descending:
+        raise ValueError("Cursor does not match the requested ordering")
+    # The key is bound straight into the keyset condition, so a tampered token must not reach it
+    expected_length = 1 if order_by == "id" else 2
+    if not isinstance(key, list) or len(key) != expected_length or not all(_is_scalar(v) for v in key):
+        raise ValueError("Invalid cursor")
+    return key
+
+def _is_scalar(value: Any) -> bool:
+    """Whether SQLite can bind the (JSON-decoded) value as a parameter."""
+    return value is None or isinstance(value, (str, int, float))
+
+def _build_filter(flt: Dict[str, Any], valid_columns: set):
+    """Returns (sql_fragment, params) for a single filter predicate."""
+    column = flt.get("column")
+    op = flt.get("op", "eq")
+    value = flt.get("value")
+    if column not in valid_columns:
+        raise ValueError(f"Invalid filter column: {column}")
+
+    if op in FILTER_OPERATORS:
+        if value is None or not _is_scalar(value):
+            raise ValueError(f"Filter '{op}' on '{column}' requires a single value")
+        return f"{column} {FILTER_OPERATORS[op]} ?", [value]
+    if op == "like":
+        if not isinstance(value, str):
+            raise ValueError(f"Filter 'like' on '{column}' requires a string pattern")
+        return f"{column} LIKE ?", [value]
+    if op == "in":
+        if not isinstance(value, list) or not value:
+            raise ValueError(f"Filter 'in' on '{column}' requires a non-empty list")
+        if len(value) > MAX_IN_VALUES:
+            raise ValueError(f"Filter 'in' accepts at most {MAX_IN_VALUES} values")
+        if not all(_is_scalar(item) for item in value):
+            raise ValueError(f"Filter 'in' on '{column}' accepts only single values")
+        return f"{column} IN ({', '.join(['?'] * len(value))})", list(value)
+    if op == "is_null":
+        return (f"{column} IS NULL" if value in (None, True) else f"{column} IS NOT NULL"), []
+    raise ValueError(f"Unknown filter operator: {op}")
+
+def _keyset_condition(order_by: str, descending: bool, key: List[Any]):
+    """
+    Returns (sql_fragment, params) selecting rows strictly after the cursor key.
+    Rows are ordered by (order_by, id); NULLs sort first ascending and last descending.
+    """
+    if order_by == "id":
+        return ("id < ?" if descending else "id > ?"), [key[0]]
+
+    last_value, last_id = key
+    if not descending:
+        if last_value is None:
+            return f"(({order_by} IS NULL AND id > ?) OR {order_by} IS NOT NULL)", [last_id]
+        return f"({order_by} > ? OR ({order_by} = ? AND id > ?))", [last_value, last_value, last_id]
+    if last_value is None:
+        return f"({order_by} IS NULL AND id < ?)", [last_id]
+    return (f"({order_by} < ? OR ({order_by} = ? AND id < ?) OR {order_by} IS NULL)",
+            [last_value, last_value, last_id])
+
+def query_rows(
+    filename: str,
+    table_name: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    order_by: str = "id",
+    descending: bool = False,
+    filters: Optional[List[Dict[str, Any]]] = None,
+    columnar: bool = False,
+) -> Dict[str, Any]:
+    """
+    Returns one page of rows using keyset pagination.
+    The result contains 'rows' and 'next_cursor' (None on the last page).
+    Every page costs the same regardless of how deep into the table it is.
+    columnar: rows are tuples in the order of an added 'columns' list instead of dicts.
+    """
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    with sqlite_pool.connection(filepath) as conn:
+        db_cursor = conn.cursor()
+        columns_info = _table_columns(conn, filepath, table_name)
+        if not columns_info:
+             raise ValueError(f"Table '{table_name}' not found")
+        valid_columns = [col["name"] for col in columns_info]
+        valid_set = set(valid_columns)
+
+        projection = list(columns) if columns else valid_columns
+        for col in projection:
+            if col not in valid_set:
+                raise ValueError(f"Invalid column: {col}")
+        if order_by not in valid_set:
+            raise ValueError(f"Invalid sort column: {order_by}")
+
+        where_clauses = []
+        params: List[Any] = []
+        for flt in filters or []:
+            clause, clause_params = _build_filter(flt, valid_set)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+
+        if cursor:
+            key = _decode_cursor(cursor, order_by, descending)
+            clause, clause_params = _keyset_condition(order_by, descending, key)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+
+        # The sort key is always selected after the projection so the next cursor can be built
+        key_columns = ["id"] if order_by == "id" else [order_by, "id"]
+        direction = "DESC" if descending else "ASC"
+        order_clause = ", ".join(f"{col} {direction}" for col in key_columns)
+        query = f"SELECT {', '.join(projection + key_columns)} FROM {table_name}"
+        if where_clauses:
+            query += f" WHERE {' AND '.join(where_clauses)}"
+        query += f" ORDER BY {order_clause} LIMIT ?;"
+        params.append(limit + 1)
+
+        with metrics.sql_seconds.time(source="rows_query"):
+            db_cursor.execute(query, params)
+            fetched = db_cursor.fetchall()
+
+    width = len(projection)
+    has_more = len(fetched) > limit
+    fetched = fetched[:limit]
+    next_cursor = None
+    if has_more and fetched:
+        next_cursor = _encode_cursor(order_by, descending, list(fetched[-1][width:]))
+    if columnar:
+        return {"columns": projection, "rows": [row[:width] for row in fetched], "next_cursor": next_cursor}
+    return {"rows": [dict(zip(projection, row[:width])) for row in fetched], "next_cursor": next_cursor}
+
+def iter_query(
+    filepath: str,
+    query: str,
+    params: tuple = (),
+    batch_size: int = STREAM_BATCH_SIZE,
+    readonly: bool = False,
+    prepare=None,
+) -> Iterator[list]:
+    """
+    Generator that streams the results of a query with cursor.fetchmany.
+    The first item yielded is the list of column names, followed by lists of row tuples.
+    The pooled connection is held until the generator is exhausted or closed.
+    prepare(conn) is called before the query runs, e.g. to check its plan.
+    """
+    with sqlite_pool.connection(filepath, readonly=readonly) as conn:
+        if prepare is not None:
+            prepare(conn)
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        yield [desc[0] for desc in cursor.description or []]
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+def iter_table_rows(filename: str, table_name: str, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[list]:
+    """
+    Streams every row of a table in id order.
+    Yields the column names first, then batches of row tuples (see iter_query).
+    """
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+
+    rows = iter_query(filepath, f"SELECT * FROM {table_name} ORDER BY id;", (), batch_size)
+    try:
+        columns = next(rows)
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+             raise ValueError(f"Table '{table_name}' not found")
+        raise e
+    yield columns
+    yield from rows
+
+def _prepare_operation(table_name: str, op: Dict[str, Any], valid_columns: set, renumber_ids: bool):
+    """
+    Validates one batch operation and returns (statement, params, row_id).
+    Rows sharing the same statement can be run together with executemany.
+    Deletes on renumbering tables have no statement and run one at a time.
+    """
+    kind = op.get("op", "insert")
+    data = op.get("data") or {}
+    row_id = op.get("id")
+
+    if kind not in ("insert", "update", "delete"):
+        raise ValueError(f"Unknown operation: {kind}")
+
+    if kind == "insert":
+        filtered_data = {k: v for k, v in data.items() if k in valid_columns and k != 'id'}
+        if data and not filtered_data:
+            raise ValueError("No valid columns provided")
+        columns = list(filtered_data.keys())
+        if not columns:
+            return f"INSERT INTO {table_name} DEFAULT VALUES;", (), None
+        placeholders = ", ".join(["?"] * len(columns))
+        statement = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders});"
+        return statement, tuple(filtered_data.values()), None
+
+    if row_id is None:
+        raise ValueError(f"'{kind}' operations require an id")
+
+    if kind == "update":
+        filtered_data = {k: v for k, v in data.items() if k in valid_columns and k != 'id'}
+        if not filtered_data:
+            raise ValueError("No valid columns provided")
+        set_clause = ", ".join(f"{col} = ?" for col in filtered_data)
+        statement = f"UPDATE {table_name} SET {set_clause} WHERE id = ?;"
+        return statement, tuple(filtered_data.values()) + (row_id,), row_id
+
+    if renumber_ids:
+        return None, (), row_id
+    return f"DELETE FROM {table_name} WHERE id = ?;", (row_id,), row_id
+
+def _run_group(cursor: sqlite3.Cursor, table_name: str, statement: Optional[str], group: List[tuple], results: List[Dict[str, Any]]):
+    """Runs consecutive operations that share a statement and records their ids."""
+    if statement is None:
+        # Renumbering deletes shift the following rows, so they must run one at a time in order
+        for index, _, row_id in group:
+            _delete_and_renumber(cursor, table_name, row_id)
+            results[index]["id"] = row_id
+        _reset_sequence(cursor, table_name)
+        return
+
+    cursor.executemany(statement, [params for _, params, _ in group])
+    if statement.startswith("INSERT"):
+        # AUTOINCREMENT ids inside one write transaction are consecutive
+        cursor.execute("SELECT last_insert_rowid();")
+        last_id = cursor.fetchone()[0]
+        first_id = last_id - len(group) + 1
+        for offset, (index, _, _) in enumerate(group):
+            results[index]["id"] = first_id + offset
+    else:
+        for index, _, row_id in group:
+            results[index]["id"] = row_id
+
+def _existing_targets(cursor: sqlite3.Cursor, table_name: str, chunk: List[tuple], results: List[Dict[str, Any]]) -> List[tuple]:
+    """
+    Returns the operations of a chunk that can run, reporting updates and deletes of missing rows
+    instead of silently ignoring them. Called inside the write transaction so no delete can slip in between.
+    """
+    # Renumbering deletes change ids, so existence can't be checked up front
+    if any(statement is None for _, statement, _, _ in chunk):
+        return list(chunk)
+
+    target_ids = list({row_id for _, _, _, row_id in chunk if row_id is not None})
+    existing_ids = set()
+    for start in range(0, len(target_ids), MAX_IN_VALUES):
+        part = target_ids[start:start + MAX_IN_VALUES]
+        cursor.execute(f"SELECT id FROM {table_name} WHERE id IN ({', '.join(['?'] * len(part))});", part)
+        existing_ids.update(row[0] for row in cursor.fetchall())
+
+    runnable = []
+    for index, statement, params, row_id in chunk:
+        if row_id is not None and row_id not in existing_ids:
+            results[index]["error"] = f"Row {row_id} not found"
+        else:
+            runnable.append((index, statement, params, row_id))
+    return runnable
+
+def _run_chunk(conn: sqlite3.Connection, table_name: str, chunk: List[tuple], results: List[Dict[str, Any]]):
+    """
+    Applies one chunk of prepared operations in a single transaction.
+    If the fast path fails, the chunk is replayed row by row so only the offending rows are reported.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE;")
+        runnable = _existing_targets(cursor, table_name, chunk, results)
+        group: List[tuple] = []
+        group_statement = None
+        for index, statement, params, row_id in runnable:
+            if group and statement != group_statement:
+                _run_group(cursor, table_name, group_statement, group, results)
+                group = []
+            group_statement = statement
+            group.append((index, params, row_id))
+        if group:
+            _run_group(cursor, table_name, group_statement, group, results)
+        conn.commit()
+        return
+    except sqlite3.Error:
+        conn.rollback()
+
+    # Slow path: isolate failures with a savepoint per operation
+    cursor.execute("BEGIN IMMEDIATE;")
+    for index, _, _, _ in chunk:
+        results[index]["id"], results[index]["error"] = None, None
+    for index, statement, params, row_id in _existing_targets(cursor, table_name, chunk, results):
+        cursor.execute("SAVEPOINT batch_row;")
+        try:
+            _run_group(cursor, table_name, statement, [(index, params, row_id)], results)
+            cursor.execute("RELEASE SAVEPOINT batch_row;")
+        except sqlite3.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT batch_row;")
+            cursor.execute("RELEASE SAVEPOINT batch_row;")
+            results[index]["id"] = None
+            results[index]["error"] = str(e)
     conn.commit()
-    conn.close()
+
+@contextmanager
+def _deferred_indexes(conn: sqlite3.Connection, table_name: str):
+    """
+    Drops the non-unique indexes of a table for the duration of a bulk load and rebuilds them afterwards.
+    Building an index once over the loaded rows is much cheaper than updating it for every insert.
+    Unique indexes stay in place so they keep rejecting duplicates.
+    The drop, the load and the rebuild are one transaction: readers keep the indexes meanwhile,
+    and an error rolls all of it back. Yields whether any index was deferred.
+    """
+    deferred = []
+    for _, name, unique, origin, _ in conn.execute("SELECT * FROM pragma_index_list(?);", (table_name,)).fetchall():
+        if origin == "c" and not unique:
+            sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?;", (name,)).fetchone()[0]
+            deferred.append((name, sql))
+    if not deferred:
+        yield False
+        return
+
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        for name, _ in deferred:
+            conn.execute(f"DROP INDEX {name};")
+        yield True
+        for _, sql in deferred:
+            conn.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def insert_rows(
+    filename: str,
+    table_name: str,
+    columns: List[str],
+    rows: Iterable[tuple],
+    batch_size: int = BATCH_CHUNK_SIZE,
+    on_batch=None,
+    defer_indexes: bool = True,
+) -> int:
+    """
+    Bulk-inserts rows (tuples in the order of columns) with executemany, one transaction per batch.
+    rows may be a generator; only one batch is held in memory at a time.
+    on_batch(inserted_so_far) is called after every batch.
+    Batches committed before an error are kept. If the table has non-unique indexes and defer_indexes
+    is set, the whole load is one transaction instead (see _deferred_indexes) and an error keeps nothing.
+    Returns the number of rows inserted.
+    """
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    if batch_size < 1 or batch_size > MAX_BATCH_CHUNK_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_CHUNK_SIZE}")
+
+    inserted = 0
+    with sqlite_pool.connection(filepath) as conn:
+        valid_columns = {col["name"] for col in _table_columns(conn, filepath, table_name)}
+        if not valid_columns:
+            raise ValueError(f"Table '{table_name}' not found")
+        for column in columns:
+            if column not in valid_columns:
+                raise ValueError(f"Column '{column}' not found")
+        statement = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))});"
+
+        cursor = conn.cursor()
+        try:
+            with _deferred_indexes(conn, table_name) if defer_indexes else nullcontext(False) as deferred:
+
+                def write(batch):
+                    # Inside _deferred_indexes the transaction is already open and is committed at the end
+                    if not deferred:
+                        cursor.execute("BEGIN IMMEDIATE;")
+                    cursor.executemany(statement, batch)
+                    if not deferred:
+                        conn.commit()
+
+                batch = []
+                try:
+                    for row in rows:
+                        batch.append(row)
+                        if len(batch) < batch_size:
+                            continue
+                        write(batch)
+                        inserted += len(batch)
+                        batch = []
+                        if on_batch is not None:
+                            on_batch(inserted)
+                    if batch:
+                        write(batch)
+                        inserted += len(batch)
+                        if on_batch is not None:
+                            on_batch(inserted)
+                except sqlite3.IntegrityError as e:
+                    raise ValueError(f"Rows {inserted + 1}-{inserted + len(batch)} rejected: {e}")
+        finally:
+            # After the commit, so readers can't cache the old rows under the new data version
+            _mark_changed(filepath)
+    return inserted
+
+def apply_row_batch(filename: str, table_name: str, operations: List[Dict[str, Any]], chunk_size: int = BATCH_CHUNK_SIZE) -> List[Dict[str, Any]]:
+    """
+    Applies a list of insert/update/delete operations to a table.
+    Each operation is a dict with 'op' (insert, update or delete), 'id' and 'data'.
+    Columns are validated once, consecutive operations of the same shape run through
+    executemany, and every chunk_size operations are committed in one transaction.
+    Returns one {'index', 'id', 'error'} dict per operation, in input order.
+    """
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    if chunk_size < 1 or chunk_size > MAX_BATCH_CHUNK_SIZE:
+        raise ValueError(f"chunk_size must be between 1 and {MAX_BATCH_CHUNK_SIZE}")
+
+    results = [{"index": i, "id": None, "error": None} for i in range(len(operations))]
+
+    with sqlite_pool.connection(filepath) as conn:
+        cursor = conn.cursor()
+        columns_info = _table_columns(conn, filepath, table_name)
+        if not columns_info:
+             raise ValueError(f"Table '{table_name}' not found")
+        valid_columns = {col["name"] for col in columns_info}
+        renumber_ids = _renumbers_ids(cursor, table_name)
+
+        prepared = []
+        for index, op in enumerate(operations):
+            try:
+                statement, params, row_id = _prepare_operation(table_name, op, valid_columns, renumber_ids)
+            except ValueError as e:
+                results[index]["error"] = str(e)
+                continue
+            prepared.append((index, statement, params, row_id))
+
+        try:
+            for start in range(0, len(prepared), chunk_size):
+                _run_chunk(conn, table_name, prepared[start:start + chunk_size], results)
+        finally:
+            # Earlier chunks may have committed even if a later one failed
+            _mark_changed(filepath)
+
+    return results
+
+def delete_rows(
+    filename: str,
+    table_name: str,
+    ids: Optional[List[int]] = None,
+    start_id: Optional[int] = None,
+    end_id: Optional[int] = None,
+) -> int:
+    """
+    Deletes a list of ids or an inclusive id range in one statement.
+    Returns the number of rows deleted.
+    """
+    filepath = get_db_path(filename)
+
+    if not table_name.isidentifier():
+        raise ValueError("Invalid table name")
+    if ids is None and (start_id is None or end_id is None):
+        raise ValueError("Provide either ids or both start_id and end_id")
+
+    if ids is not None:
+        target = "id IN (SELECT value FROM json_each(?))"
+        params: tuple = (json.dumps(ids),)
+    else:
+        target = "id BETWEEN ? AND ?"
+        params = (start_id, end_id)
+
+    with sqlite_pool.connection(filepath) as conn:
+        cursor = conn.cursor()
+        try:
+            renumber_ids = _renumbers_ids(cursor, table_name)
+            cursor.execute("BEGIN IMMEDIATE;")
+            if renumber_ids:
+                cursor.execute(f"SELECT id FROM {table_name} WHERE {target} ORDER BY id;", params)
+                deleted_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f"DELETE FROM {table_name} WHERE {target};", params)
+            deleted = cursor.rowcount
+            if renumber_ids and deleted:
+                # Rows between the n-th and (n+1)-th deleted id move down by n: one range UPDATE per gap,
+                # lowest first so every row moves into ids that are already free
+                for shift, (low, high) in enumerate(zip(deleted_ids, deleted_ids[1:] + [None]), start=1):
+                    if high is None:
+                        cursor.execute(f"UPDATE {table_name} SET id = id - ? WHERE id > ?;", (shift, low))
+                    elif high > low + 1:
+                        cursor.execute(f"UPDATE {table_name} SET id = id - ? WHERE id > ? AND id < ?;", (shift, low, high))
+                _reset_sequence(cursor, table_name)
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                 raise ValueError(f"Table '{table_name}' not found")
+            raise e
+    _mark_changed(filepath)
+    return deleted
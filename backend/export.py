@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from typing import Any, Iterable, Iterator, List
+
+try:
+    import orjson
+except ImportError:  # optional: the json module is used instead
+    orjson = None
+
+# Supported export formats and their media types
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+def _json_default(value: Any):
+    """Encodes values the json module cannot handle (BLOB columns come back as bytes)."""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_bytes(value: Any) -> bytes:
+    """
+    Compact UTF-8 JSON, encoded by orjson when it is installed.
+    Tuples encode as arrays, so row tuples from a cursor can be passed as they are.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default)
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+def _dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=_json_default).decode()
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+def encode_csv(columns: List[str], batches: Iterable[list]) -> Iterator[str]:
+    """Yields a CSV header followed by one chunk of CSV text per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+def encode_ndjson(columns: List[str], batches: Iterable[list]) -> Iterator[str]:
+    """Yields one JSON object per line, one chunk per batch."""
+    for batch in batches:
+        yield "".join(_dumps(dict(zip(columns, row))) + "\n" for row in batch)
+
+def encode_json_array(columns: List[str], batches: Iterable[list]) -> Iterator[str]:
+    """Yields a single JSON array of objects, one chunk per batch."""
+    yield "["
+    first = True
+    for batch in batches:
+        chunk = ",".join(_dumps(dict(zip(columns, row))) for row in batch)
+        if not chunk:
+            continue
+        yield chunk if first else "," + chunk
+        first = False
+    yield "]"
+
+_ENCODERS = {
+    "csv": encode_csv,
+    "ndjson": encode_ndjson,
+    "json": encode_json_array,
+}
+
+def encode(fmt: str, columns: List[str], batches: Iterable[list]) -> Iterator[str]:
+    """Returns an iterator of text chunks for the given export format."""
+    if fmt not in _ENCODERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return _ENCODERS[fmt](columns, batches)
+
+def sse_event(event: str, data: Any) -> str:
+    """Formats one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {_dumps(data)}\n\n"
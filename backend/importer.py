@@ -0,0 +1,169 @@
+import csv
+import io
+import itertools
+import json
+import os
+from typing import Any, Dict, Iterator, List, Optional
+
+import dynamic_db
+
+# Supported import formats and the media types that select them
+IMPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+# Rows per insert batch (and per transaction, unless dynamic_db.insert_rows defers indexes)
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+# Rows read up front to infer column types
+IMPORT_SAMPLE_ROWS = int(os.getenv("IMPORT_SAMPLE_ROWS", "1000"))
+
+
+class _CountingReader(io.RawIOBase):
+    """Wraps a binary file and counts the bytes read, for progress reporting."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        count = self.raw.readinto(buffer)
+        self.bytes_read += count or 0
+        return count
+
+
+def iter_records(text: io.TextIOBase, fmt: str) -> Iterator[Dict[str, Any]]:
+    """Yields one dict per CSV row or NDJSON line, reading the file incrementally."""
+    if fmt == "csv":
+        yield from csv.DictReader(text)
+        return
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number} is not valid JSON: {e}")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number} is not a JSON object")
+        yield record
+
+
+def _value_type(value: Any) -> Optional[str]:
+    """SQLite type of a single value, or None for empty values that say nothing about the type."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool) or isinstance(value, int):
+        return "INTEGER"
+    if isinstance(value, float):
+        return "REAL"
+    if isinstance(value, str):
+        try:
+            int(value)
+            return "INTEGER"
+        except ValueError:
+            pass
+        try:
+            float(value)
+            return "REAL"
+        except ValueError:
+            pass
+    return "TEXT"
+
+
+def infer_types(records: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Maps each column (in order of first appearance) to INTEGER, REAL or TEXT.
+    A column is numeric only if every non-empty sampled value is; INTEGER widens to REAL.
+    """
+    types: Dict[str, Optional[str]] = {}
+    for record in records:
+        for column, value in record.items():
+            seen = types.get(column)
+            current = _value_type(value)
+            if current is None or seen == "TEXT":
+                types.setdefault(column, seen)
+            elif seen is None or seen == current:
+                types[column] = current
+            elif {seen, current} == {"INTEGER", "REAL"}:
+                types[column] = "REAL"
+            else:
+                types[column] = "TEXT"
+    return {column: column_type or "TEXT" for column, column_type in types.items()}
+
+
+def convert_value(value: Any, column_type: str) -> Any:
+    """Converts a parsed value for storage. Values that do not fit the column type are stored as given."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, str) and column_type in ("INTEGER", "REAL"):
+        try:
+            return int(value) if column_type == "INTEGER" else float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def run_import(filename: str, table_name: str, fmt: str, path: str, progress: Dict[str, Any], batch_size: int = IMPORT_BATCH_SIZE, on_progress=None) -> Dict[str, Any]:
+    """
+    Imports a spooled CSV/NDJSON file into a table, creating the table if it does not exist.
+    Column types are inferred from the first IMPORT_SAMPLE_ROWS rows; the file is read once
+    and inserted in batches, so memory use does not depend on the file size.
+    NDJSON keys that first appear after the sampled rows are ignored.
+    progress is updated in place ('rows_imported', 'bytes_read', 'total_bytes') and on_progress()
+    is called after every batch; it may raise to stop the import.
+    Returns a summary; raises ValueError for invalid input.
+    """
+    progress.update({"rows_imported": 0, "bytes_read": 0, "total_bytes": os.path.getsize(path)})
+    with open(path, "rb") as raw:
+        counter = _CountingReader(raw)
+        text = io.TextIOWrapper(io.BufferedReader(counter), encoding="utf-8-sig", newline="")
+        records = iter_records(text, fmt)
+        try:
+            sample = list(itertools.islice(records, IMPORT_SAMPLE_ROWS))
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise ValueError(f"Could not parse the file: {e}")
+        types = infer_types(sample)
+        if not types:
+            raise ValueError("The file contains no rows")
+        for column in types:
+            if column is None:
+                raise ValueError("A row has more fields than the header")
+            if not column.isidentifier():
+                raise ValueError(f"Invalid column name: {column}")
+
+        table_created = False
+        existing = {col["name"]: col["type"] for col in dynamic_db.get_columns(filename, table_name)}
+        if existing:
+            unknown = [column for column in types if column not in existing]
+            if unknown:
+                raise ValueError(f"Columns not in table '{table_name}': {', '.join(unknown)}")
+            types = {column: (existing[column] or "TEXT").upper() for column in types}
+        else:
+            dynamic_db.create_table(
+                filename, table_name, [{"name": c, "type": t} for c, t in types.items() if c != "id"]
+            )
+            table_created = True
+
+        columns = list(types)
+
+        def rows():
+            try:
+                for record in itertools.chain(sample, records):
+                    yield tuple(convert_value(record.get(column), types[column]) for column in columns)
+            except (UnicodeDecodeError, csv.Error) as e:
+                raise ValueError(f"Could not parse the file: {e}")
+
+        def on_batch(inserted: int):
+            progress["rows_imported"] = inserted
+            progress["bytes_read"] = counter.bytes_read
+            if on_progress is not None:
+                on_progress()
+
+        inserted = dynamic_db.insert_rows(filename, table_name, columns, rows(), batch_size, on_batch=on_batch)
+    progress["bytes_read"] = progress["total_bytes"]
+    return {"table": table_name, "table_created": table_created, "columns": types, "rows_imported": inserted}
@@ -0,0 +1,123 @@
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Set
+
+import dynamic_db
+import sqlite_pool
+
+logger = logging.getLogger(__name__)
+
+# A column set becomes a suggestion after this many /ask queries filtered on it with a full table scan
+INDEX_ADVISOR_MIN_HITS = int(os.getenv("INDEX_ADVISOR_MIN_HITS", "5"))
+# Small tables are scanned quickly enough without an index
+INDEX_ADVISOR_MIN_ROWS = int(os.getenv("INDEX_ADVISOR_MIN_ROWS", "1000"))
+# Create suggested indexes automatically (in a background job) instead of only reporting them
+INDEX_ADVISOR_AUTO_CREATE = os.getenv("INDEX_ADVISOR_AUTO_CREATE", "false").lower() in ("1", "true", "yes")
+
+# Column references used as predicates: [alias.]column followed by a comparison
+_PREDICATE = re.compile(
+    r"(?:\b\w+\.)?\b(\w+)\s*(?:=|!=|<>|<=|>=|<|>|\bIS\b|(?:\bNOT\s+)?\b(?:IN|LIKE|BETWEEN|GLOB)\b)",
+    re.IGNORECASE,
+)
+# Where a WHERE clause ends
+_WHERE_CLAUSE = re.compile(
+    r"\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|\bWINDOW\b|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+
+_lock = threading.Lock()
+# filepath -> {(table, columns): hits}
+_usage: Dict[str, Dict[tuple, int]] = {}
+# filepath -> column sets already handed to an automatic index job
+_claimed: Dict[str, Set[tuple]] = {}
+
+
+def where_columns(sql: str) -> List[str]:
+    """Names used as predicates in the WHERE clauses of a query, in order of first use."""
+    names = []
+    for clause in _WHERE_CLAUSE.finditer(sql):
+        for match in _PREDICATE.finditer(clause.group(1)):
+            names.append(match.group(1))
+    return list(dict.fromkeys(names))
+
+
+def record(filepath: str, sql: str, scanned_tables: List[str], tables: Dict[str, List[Dict[str, Any]]]):
+    """
+    Counts the WHERE columns of a query against each table the plan scans in full.
+    tables is the schema (table -> columns) used to tell which table a column belongs to.
+    """
+    if not scanned_tables:
+        return
+    names = where_columns(sql)
+    if not names:
+        return
+    with _lock:
+        usage = _usage.setdefault(filepath, {})
+        for table in dict.fromkeys(scanned_tables):
+            table_columns = {col["name"].lower(): col["name"] for col in tables.get(table, [])}
+            columns = tuple(dict.fromkeys(table_columns[n.lower()] for n in names if n.lower() in table_columns))
+            if columns:
+                key = (table, columns)
+                usage[key] = usage.get(key, 0) + 1
+
+
+def get_suggestions(filename: str) -> List[Dict[str, Any]]:
+    """
+    Returns the indexes worth creating, most used first.
+    Column sets already covered by the leading columns of an existing index are skipped.
+    """
+    filepath = dynamic_db.get_db_path(filename)
+    with _lock:
+        usage = dict(_usage.get(filepath, {}))
+
+    tables = dynamic_db.get_schema(filename).tables
+    suggestions = []
+    for (table, columns), hits in sorted(usage.items(), key=lambda item: -item[1]):
+        if hits < INDEX_ADVISOR_MIN_HITS or table not in tables:
+            continue
+        existing = dynamic_db.get_indexes(filename, table)
+        if any(index["columns"][:len(columns)] == list(columns) for index in existing):
+            continue
+        with sqlite_pool.connection(filepath) as conn:
+            rows = dynamic_db.estimate_row_count(conn, table)
+        if rows < INDEX_ADVISOR_MIN_ROWS:
+            continue
+        suggestions.append({"table": table, "columns": list(columns), "hits": hits, "estimated_rows": rows})
+    return suggestions
+
+
+def claim_new_candidates(filename: str) -> bool:
+    """
+    Whether a column set has reached INDEX_ADVISOR_MIN_HITS since the last call that returned True.
+    Used to queue automatic index creation once per new candidate instead of after every query.
+    """
+    filepath = dynamic_db.get_db_path(filename)
+    with _lock:
+        ready = {key for key, hits in _usage.get(filepath, {}).items() if hits >= INDEX_ADVISOR_MIN_HITS}
+        claimed = _claimed.setdefault(filepath, set())
+        if ready <= claimed:
+            return False
+        claimed.update(ready)
+        return True
+
+
+def apply_suggestions(filename: str) -> List[Dict[str, Any]]:
+    """Creates every suggested index. Returns the indexes that were created."""
+    created = []
+    for suggestion in get_suggestions(filename):
+        try:
+            created.append(dynamic_db.create_index(filename, suggestion["table"], suggestion["columns"]))
+        except ValueError as e:
+            logger.warning("Index advisor could not index %s%s: %s", suggestion["table"], suggestion["columns"], e)
+            continue
+        logger.info("Index advisor created %s on %s%s", created[-1]["name"], suggestion["table"], suggestion["columns"])
+    return created
+
+
+def forget_database(filename: str):
+    """Drops the usage statistics of a deleted database."""
+    with _lock:
+        _usage.pop(dynamic_db.get_db_path(filename), None)
+        _claimed.pop(dynamic_db.get_db_path(filename), None)
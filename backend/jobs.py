@@ -0,0 +1,435 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import ai_agent
+import ai_cache
+import async_db
+import crud
+import dynamic_db
+import export
+import importer
+import index_advisor
+import models
+import shared_state
+from database import SessionLocal
+
+# Jobs running at once across all users, and per user
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_RUNNING_PER_USER = int(os.getenv("JOB_MAX_RUNNING_PER_USER", "2"))
+# Queued plus running jobs a user may have before new submissions are refused
+JOB_MAX_PENDING_PER_USER = int(os.getenv("JOB_MAX_PENDING_PER_USER", "20"))
+# Where export jobs write their output
+JOB_RESULTS_DIR = os.getenv("JOB_RESULTS_DIR", "job_results")
+# Time limit for the SQL of an 'ask' job (the interactive /ask limit is much lower)
+JOB_ASK_TIMEOUT_SECONDS = float(os.getenv("JOB_ASK_TIMEOUT_SECONDS", "300"))
+# Progress is written to users.db at most this often
+JOB_PROGRESS_INTERVAL_SECONDS = 1.0
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+# Kinds whose work is a single statement that can't be interrupted, so they can only be cancelled while queued
+UNINTERRUPTIBLE_KINDS = ("drop_column",)
+
+
+class JobQueueFull(Exception):
+    """Raised when a user already has JOB_MAX_PENDING_PER_USER unfinished jobs."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been cancelled."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """
+    What a job handler gets: its parameters, a progress dict and a cancellation flag.
+    Cancelling only sets the flag; handlers stop at their next checkpoint (or should_stop() check),
+    so a job is never reported cancelled while its work is still running on a thread.
+    """
+
+    def __init__(self, job: models.Job, filename: str):
+        self.job_id = job.id
+        self.user_id = job.owner_id
+        self.database_id = job.database_id
+        self.kind = job.kind
+        self.params = dict(job.params or {})
+        self.input_path = job.input_path
+        self.filename = filename
+        self.progress: Dict[str, Any] = {}
+        self.result_path: Optional[str] = None
+        self.cancelled = threading.Event()
+        self._last_saved = 0.0
+
+    def should_stop(self) -> bool:
+        return self.cancelled.is_set()
+
+    def checkpoint(self):
+        """
+        Called by handlers between units of work (possibly from a worker thread).
+        Raises JobCancelled after a cancel and saves progress now and then.
+        """
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        now = time.monotonic()
+        if now - self._last_saved >= JOB_PROGRESS_INTERVAL_SECONDS:
+            self._last_saved = now
+            _update_job(self.job_id, progress=dict(self.progress))
+
+
+def _update_job(job_id: int, **fields):
+    """Writes job fields in a short-lived session (safe to call from any thread)."""
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _remove_file(path: Optional[str]):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+# Job handlers. Each runs on the event loop and returns a JSON-serializable result;
+# blocking work goes through async_db so it counts against the database's concurrency limit.
+
+async def _run_import(ctx: JobContext) -> Dict[str, Any]:
+    try:
+        return await async_db.call(
+            importer.run_import, ctx.filename, ctx.params["table"], ctx.params["format"], ctx.input_path,
+            ctx.progress, on_progress=ctx.checkpoint,
+        )
+    finally:
+        _remove_file(ctx.input_path)
+
+
+async def _run_vacuum(ctx: JobContext) -> Dict[str, Any]:
+    return await async_db.call(dynamic_db.vacuum, ctx.filename, should_stop=ctx.should_stop)
+
+
+async def _run_drop_column(ctx: JobContext) -> Dict[str, Any]:
+    await async_db.call(dynamic_db.drop_column, ctx.filename, ctx.params["table"], ctx.params["column"])
+    return {"table": ctx.params["table"], "dropped": ctx.params["column"]}
+
+
+async def _run_apply_indexes(ctx: JobContext) -> Dict[str, Any]:
+    return {"created": await async_db.call(index_advisor.apply_suggestions, ctx.filename)}
+
+
+def _write_export(filename: str, ctx: JobContext) -> Dict[str, Any]:
+    fmt = ctx.params.get("format", "csv")
+    if fmt not in export.EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    if ctx.params.get("sql"):
+        rows = ai_agent.iter_read_only_sql(filename, ctx.params["sql"], should_stop=ctx.should_stop)
+    elif ctx.params.get("table"):
+        rows = dynamic_db.iter_table_rows(filename, ctx.params["table"])
+    else:
+        raise ValueError("An export needs a 'table' or 'sql' parameter")
+
+    ctx.progress["rows_exported"] = 0
+
+    def batches():
+        for batch in rows:
+            ctx.checkpoint()
+            yield batch
+            ctx.progress["rows_exported"] += len(batch)
+
+    os.makedirs(JOB_RESULTS_DIR, exist_ok=True)
+    ctx.result_path = os.path.join(JOB_RESULTS_DIR, f"job_{ctx.job_id}.{fmt}")
+    try:
+        columns = next(rows)
+        with open(ctx.result_path, "w", encoding="utf-8", newline="") as f:
+            for chunk in export.encode(fmt, columns, batches()):
+                f.write(chunk)
+    except BaseException:
+        rows.close()
+        _remove_file(ctx.result_path)
+        ctx.result_path = None
+        raise
+    return {"format": fmt, "rows": ctx.progress["rows_exported"], "bytes": os.path.getsize(ctx.result_path)}
+
+
+async def _run_export(ctx: JobContext) -> Dict[str, Any]:
+    return await async_db.call(_write_export, ctx.filename, ctx)
+
+
+async def _run_ask(ctx: JobContext) -> Dict[str, Any]:
+    """/ask without the interactive time limit: SQL is generated (or reused) and run up to JOB_ASK_TIMEOUT_SECONDS."""
+    question = ctx.params.get("question")
+    if not question:
+        raise ValueError("An ask job needs a 'question' parameter")
+    schema = await async_db.call(dynamic_db.get_schema, ctx.filename)
+    sql = ai_cache.get_sql(ctx.filename, schema.fingerprint, question)
+    if sql is None:
+        context = await async_db.call(ai_agent.get_schema_context, ctx.filename, question)
+        sql = await ai_agent.generate_sql(context, question)
+    ctx.checkpoint()
+    ctx.progress["sql_query"] = sql
+    execution = await async_db.call(
+        ai_agent.execute_read_only_sql, ctx.filename, sql,
+        timeout_seconds=JOB_ASK_TIMEOUT_SECONDS, should_stop=ctx.should_stop,
+    )
+    ai_cache.put_sql(ctx.filename, schema.fingerprint, question, sql)
+    await queue_index_suggestions(ctx.user_id, ctx.database_id, ctx.filename)
+    return {
+        "sql_query": sql,
+        "results": ai_agent.result_dicts(execution),
+        "truncated": execution["truncated"],
+        "elapsed_ms": execution["elapsed_ms"],
+        "rows_scanned": execution["rows_scanned"],
+    }
+
+
+HANDLERS: Dict[str, Callable[[JobContext], Awaitable[Dict[str, Any]]]] = {
+    "import": _run_import,
+    "export": _run_export,
+    "vacuum": _run_vacuum,
+    "drop_column": _run_drop_column,
+    "ask": _run_ask,
+    "apply_indexes": _run_apply_indexes,
+}
+# Kinds that can be submitted through the generic jobs endpoint (imports need an upload)
+SUBMITTABLE_KINDS = ("export", "vacuum", "drop_column", "ask", "apply_indexes")
+
+
+def validate_params(kind: str, params: Dict[str, Any]):
+    """Checks a submission before it is queued, so obvious mistakes fail fast."""
+    if kind not in SUBMITTABLE_KINDS:
+        raise ValueError(f"Unsupported job kind: {kind}")
+    if kind == "drop_column" and not (params.get("table") and params.get("column")):
+        raise ValueError("A drop_column job needs 'table' and 'column' parameters")
+    if kind == "export":
+        if not (params.get("table") or params.get("sql")):
+            raise ValueError("An export needs a 'table' or 'sql' parameter")
+        if params.get("format", "csv") not in export.EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {params.get('format')}")
+    if kind == "ask" and not params.get("question"):
+        raise ValueError("An ask job needs a 'question' parameter")
+
+
+async def queue_index_suggestions(user_id: int, database_id: int, filename: str):
+    """
+    Queues an 'apply_indexes' job when INDEX_ADVISOR_AUTO_CREATE is on and a new column set has
+    become an index suggestion, so CREATE INDEX never runs on the request path.
+    """
+    if not index_advisor.INDEX_ADVISOR_AUTO_CREATE or not index_advisor.claim_new_candidates(filename):
+        return
+    db = SessionLocal()
+    try:
+        await manager.submit(db, user_id, database_id, "apply_indexes", {})
+    except JobQueueFull:
+        # The suggestion stays listed at GET /databases/{id}/indexes/suggestions
+        pass
+    finally:
+        db.close()
+
+
+def fail_interrupted_jobs():
+    """
+    Marks jobs left 'running' by a previous server run as failed.
+    Called once per server start: by the job manager in single-process mode, and by the
+    `python -m backend` entry point before it starts the workers in multi-worker mode.
+    """
+    db = SessionLocal()
+    try:
+        for job in crud.get_unfinished_jobs(db):
+            if job.status == "running":
+                job.status = "failed"
+                job.error = "Interrupted by a server restart"
+                job.finished_at = _now()
+                _remove_file(job.input_path)
+        db.commit()
+    finally:
+        db.close()
+
+
+class JobManager:
+    """
+    In-process job runner. Job state lives in users.db; this class only keeps the queue order,
+    which is rebuilt from the database on start. Workers take the oldest queued job whose owner
+    is below JOB_MAX_RUNNING_PER_USER running jobs.
+    With several worker processes every process queues the recovered jobs, and whichever
+    claims a job first in users.db runs it; the per-user limit applies per process.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, per_user: int = JOB_MAX_RUNNING_PER_USER):
+        self.workers = workers
+        self.per_user = per_user
+        # (job_id, user_id) in submission order
+        self._queue: List[tuple] = []
+        self._running_per_user: Dict[int, int] = {}
+        self._active: Dict[int, JobContext] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Starts the workers on the running event loop and recovers jobs from a previous run. Idempotent."""
+        if self._tasks:
+            return
+        self._condition = asyncio.Condition()
+        if not shared_state.MULTI_WORKER:
+            # Their worker died with the previous process (other processes may still be running theirs)
+            fail_interrupted_jobs()
+        db = SessionLocal()
+        try:
+            for job in crud.get_unfinished_jobs(db):
+                if job.status == "queued":
+                    self._queue.append((job.id, job.owner_id))
+        finally:
+            db.close()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers. Running jobs are cancelled and recorded as interrupted on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _next_runnable(self) -> Optional[tuple]:
+        for entry in self._queue:
+            if self._running_per_user.get(entry[1], 0) < self.per_user:
+                return entry
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                entry = await self._condition.wait_for(self._next_runnable)
+                self._queue.remove(entry)
+                job_id, user_id = entry
+                self._running_per_user[user_id] = self._running_per_user.get(user_id, 0) + 1
+            try:
+                await self._execute(job_id)
+            finally:
+                async with self._condition:
+                    self._running_per_user[user_id] -= 1
+                    if not self._running_per_user[user_id]:
+                        del self._running_per_user[user_id]
+                    self._condition.notify_all()
+
+    async def _execute(self, job_id: int):
+        db = SessionLocal()
+        try:
+            # Claim the job atomically: another worker process may have queued it too
+            claimed = db.query(models.Job).filter(models.Job.id == job_id, models.Job.status == "queued").update(
+                {"status": "running", "started_at": _now()}, synchronize_session=False
+            )
+            db.commit()
+            if not claimed:
+                return
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            database = db.query(models.Database).filter(models.Database.id == job.database_id).first()
+            if database is None:
+                job.status, job.error, job.finished_at = "failed", "Database not found", _now()
+                db.commit()
+                _remove_file(job.input_path)
+                return
+            ctx = JobContext(job, database.filename)
+        finally:
+            db.close()
+
+        self._active[job_id] = ctx
+        watcher = asyncio.ensure_future(self._watch_cancel(ctx)) if shared_state.MULTI_WORKER else None
+        fields: Dict[str, Any] = {}
+        try:
+            result = await HANDLERS[ctx.kind](ctx)
+            # A cancel that arrives after the last checkpoint is too late: the work is done
+            fields = {"status": "completed", "result": result, "result_path": ctx.result_path}
+        except asyncio.CancelledError:
+            # The worker itself is shutting down: leave the job 'running' so the next start reports it
+            _update_job(job_id, progress=dict(ctx.progress))
+            raise
+        except Exception as e:
+            if ctx.should_stop():
+                # Stopped at a checkpoint (JobCancelled) or interrupted by the cancel (e.g. VACUUM, SQL)
+                fields = {"status": "cancelled"}
+            elif isinstance(e, ValueError):
+                fields = {"status": "failed", "error": str(e)}
+            else:
+                fields = {"status": "failed", "error": f"Job failed: {str(e)}"}
+        finally:
+            self._active.pop(job_id, None)
+            if watcher is not None:
+                watcher.cancel()
+
+        fields.update(progress=dict(ctx.progress), finished_at=_now())
+        try:
+            _update_job(job_id, **fields)
+        except Exception as e:
+            # e.g. a result that can't be stored as JSON
+            _update_job(job_id, status="failed", error=f"Could not store the job result: {e}", finished_at=_now())
+
+    async def _watch_cancel(self, ctx: JobContext):
+        """Stops a running job when a cancel for it arrives through another worker process."""
+        key = f"job_cancel:{ctx.job_id}"
+        while True:
+            await asyncio.sleep(JOB_PROGRESS_INTERVAL_SECONDS)
+            if shared_state.counters.get(key):
+                ctx.cancelled.set()
+                return
+
+    async def submit(self, db, user_id: int, database_id: int, kind: str, params: Dict[str, Any], input_path: Optional[str] = None) -> models.Job:
+        """Records a queued job and wakes a worker. Raises JobQueueFull when the user is over the limit."""
+        if crud.count_unfinished_jobs(db, user_id) >= JOB_MAX_PENDING_PER_USER:
+            raise JobQueueFull(f"Too many unfinished jobs (limit {JOB_MAX_PENDING_PER_USER})")
+        self.start()
+        job = crud.create_job(db, user_id, database_id, kind, params, input_path)
+        async with self._condition:
+            self._queue.append((job.id, user_id))
+            self._condition.notify_all()
+        return job
+
+    async def cancel(self, db, job: models.Job) -> models.Job:
+        """
+        Cancels a queued job immediately, or asks a running job to stop at its next checkpoint.
+        Raises ValueError for a running job of an UNINTERRUPTIBLE_KINDS kind.
+        """
+        if job.status == "queued":
+            if self._condition is not None:
+                async with self._condition:
+                    self._queue = [entry for entry in self._queue if entry[0] != job.id]
+            # Conditional, since a worker (possibly in another process) may have just claimed it
+            cancelled = db.query(models.Job).filter(models.Job.id == job.id, models.Job.status == "queued").update(
+                {"status": "cancelled", "finished_at": _now()}, synchronize_session=False
+            )
+            db.commit()
+            db.refresh(job)
+            if cancelled:
+                _remove_file(job.input_path)
+                return job
+        if job.status == "running":
+            if job.kind in UNINTERRUPTIBLE_KINDS:
+                raise ValueError(f"A running {job.kind} job can't be cancelled")
+            ctx = self._active.get(job.id)
+            if ctx is not None:
+                ctx.cancelled.set()
+            elif shared_state.MULTI_WORKER:
+                # Running in another worker process, which polls for this
+                shared_state.counters.incr(f"job_cancel:{job.id}")
+        return job
+
+    def discard_files(self, job: models.Job):
+        """Removes the files of a finished job before its record is deleted."""
+        _remove_file(job.input_path)
+        _remove_file(job.result_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": len(self._queue),
+            "running": len(self._active),
+            "running_per_user": dict(self._running_per_user),
+        }
+
+
+# Shared job manager used by the request handlers
+manager = JobManager()
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+import metrics
+import shared_state
+
+# "openai" talks to the configured provider; "stub" answers locally for offline load tests
+AI_BACKEND = os.getenv("AI_BACKEND", "openai")
+
+# Gateway limits for the whole server; with several worker processes each one gets an equal share
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_RATE_BURST = int(os.getenv("LLM_RATE_BURST", "10"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+
+# Simulated latency of the stub backend
+LLM_STUB_LATENCY_SECONDS = float(os.getenv("LLM_STUB_LATENCY_SECONDS", "0.05"))
+
+# Errors worth retrying; anything else (bad request, auth) fails immediately
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, asyncio.TimeoutError)
+
+
+class LLMUnavailable(Exception):
+    """Raised when the provider could not answer within the retry budget."""
+
+
+class OpenAIBackend:
+    """Chat completions through an OpenAI-compatible API with a bounded HTTP connection pool."""
+
+    def __init__(self, base_url: str, api_key: Optional[str], model: str):
+        self.model = model
+        self.client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            # Retries and timeouts are handled by the gateway
+            max_retries=0,
+            timeout=LLM_TIMEOUT_SECONDS,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONCURRENCY,
+                    max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                ),
+                timeout=LLM_TIMEOUT_SECONDS,
+            ),
+        )
+
+    async def complete(self, messages: List[Dict[str, str]], temperature: float) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+        )
+        return response.choices[0].message.content
+
+    async def stream(self, messages: List[Dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class StubBackend:
+    """
+    Offline backend for load tests.
+    Answers with a query over the first table found in the system prompt after a fixed delay.
+    """
+
+    def __init__(self, latency_seconds: float = LLM_STUB_LATENCY_SECONDS):
+        self.latency_seconds = latency_seconds
+
+    def _answer(self, messages: List[Dict[str, str]]) -> str:
+        match = re.search(r"Table '(\w+)'", messages[0]["content"])
+        if match is None:
+            return "SELECT 1 AS result"
+        return f"SELECT * FROM {match.group(1)} LIMIT 10"
+
+    async def complete(self, messages: List[Dict[str, str]], temperature: float) -> str:
+        await asyncio.sleep(self.latency_seconds)
+        return self._answer(messages)
+
+    async def stream(self, messages: List[Dict[str, str]], temperature: float) -> AsyncIterator[str]:
+        # First token after the configured latency, then one word at a time
+        await asyncio.sleep(self.latency_seconds)
+        for word in re.findall(r"\S+\s*", self._answer(messages)):
+            yield word
+            await asyncio.sleep(0)
+
+
+class TokenBucket:
+    """Allows rate_per_second calls on average with bursts of up to burst calls."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class LLMGateway:
+    """
+    Single entry point for LLM calls.
+    Identical in-flight prompts share one request; every provider call goes through
+    a concurrency limit and a token bucket, has a timeout, and retries with jittered backoff.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        workers = shared_state.BACKEND_WORKERS
+        self._semaphore = asyncio.Semaphore(max(1, LLM_MAX_CONCURRENCY // workers))
+        self._bucket = TokenBucket(LLM_RATE_PER_SECOND / workers, max(1, LLM_RATE_BURST // workers))
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.counters = {"calls": 0, "coalesced": 0, "attempts": 0, "retries": 0, "timeouts": 0, "failures": 0, "streams": 0}
+
+    async def _call_with_retries(self, messages: List[Dict[str, str]], temperature: float) -> str:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            try:
+                async with self._semaphore:
+                    self.counters["attempts"] += 1
+                    with metrics.llm_call_seconds.time(mode="complete"):
+                        return await asyncio.wait_for(self.backend.complete(messages, temperature), LLM_TIMEOUT_SECONDS)
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, (asyncio.TimeoutError, APITimeoutError)):
+                    self.counters["timeouts"] += 1
+                if attempt == LLM_MAX_RETRIES:
+                    self.counters["failures"] += 1
+                    raise LLMUnavailable(f"AI service unavailable after {attempt + 1} attempts: {e}") from e
+                self.counters["retries"] += 1
+                # Full jitter keeps a burst of failed calls from retrying in lockstep
+                delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+                await asyncio.sleep(random.uniform(0, delay))
+
+    async def complete(self, messages: List[Dict[str, str]], temperature: float = 0.0) -> str:
+        """Returns the completion text for messages, sharing the call with identical in-flight requests."""
+        self.counters["calls"] += 1
+        key = json.dumps([messages, temperature], sort_keys=True)
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._call_with_retries(messages, temperature))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: one caller disconnecting must not cancel the call for the others
+        return await asyncio.shield(task)
+
+    async def stream(self, messages: List[Dict[str, str]], temperature: float = 0.0) -> AsyncIterator[str]:
+        """
+        Yields the completion text in chunks as the provider produces them.
+        Streams are never coalesced. Failures before the first chunk are retried like complete();
+        once text has been yielded an error raises LLMUnavailable. Every chunk must arrive within LLM_TIMEOUT_SECONDS.
+        """
+        self.counters["calls"] += 1
+        self.counters["streams"] += 1
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            await self._bucket.acquire()
+            started = False
+            try:
+                async with self._semaphore:
+                    self.counters["attempts"] += 1
+                    chunks = self.backend.stream(messages, temperature).__aiter__()
+                    try:
+                        with metrics.llm_call_seconds.time(mode="stream"):
+                            while True:
+                                try:
+                                    chunk = await asyncio.wait_for(chunks.__anext__(), LLM_TIMEOUT_SECONDS)
+                                except StopAsyncIteration:
+                                    return
+                                started = True
+                                yield chunk
+                    finally:
+                        await chunks.aclose()
+            except RETRYABLE_ERRORS as e:
+                if isinstance(e, (asyncio.TimeoutError, APITimeoutError)):
+                    self.counters["timeouts"] += 1
+                if started or attempt == LLM_MAX_RETRIES:
+                    self.counters["failures"] += 1
+                    raise LLMUnavailable(f"AI service stream failed after {attempt + 1} attempts: {e}") from e
+                self.counters["retries"] += 1
+                delay = min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt))
+                await asyncio.sleep(random.uniform(0, delay))
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "in_flight": len(self._inflight), "backend": type(self.backend).__name__}
+
+
+def create_gateway(base_url: str, api_key: Optional[str], model: str) -> LLMGateway:
+    """Builds the gateway for the backend selected by AI_BACKEND."""
+    if AI_BACKEND == "stub":
+        return LLMGateway(StubBackend())
+    return LLMGateway(OpenAIBackend(base_url, api_key, model))
@@ -1,22 +1,45 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
 from datetime import timedelta
-from typing import Annotated, List
+from typing import Annotated, Any, List, Optional
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool
 from jose import JWTError, jwt
 
-import crud, models, schemas, auth, dynamic_db
+import crud, models, schemas, auth, dynamic_db, export, async_db, importer, jobs, metrics, sqlite_pool
+from cache import MISSING, token_cache, ownership_cache
 from database import SessionLocal, engine
 
 import ai_agent
+import ai_cache
+import schema_context
+import index_advisor
+import table_stats
 
 # Create database tables if they don't exist
 models.Base.metadata.create_all(bind=engine)
+# create_all skips indexes added to tables that already exist
+for index in models.Database.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume queued background jobs from users.db
+    jobs.manager.start()
+    yield
+    await jobs.manager.stop()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS middleware
 # Allow requests from frontend running on localhost:5173
@@ -29,6 +52,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so the latency includes CORS handling and streamed response bodies
+app.add_middleware(metrics.MetricsMiddleware)
 
 # Dependency to get DB session
 # Ensures each request gets a fresh DB session and it's closed after request
@@ -39,16 +64,72 @@ def get_db():
     finally:
         db.close()
 
+async def _set_when_done(body, stop: threading.Event):
+    """Iterates a blocking body on the thread pool and sets stop once the response ends or the client goes away."""
+    try:
+        async for chunk in iterate_in_threadpool(body):
+            yield chunk
+    finally:
+        stop.set()
+
+def stream_export(rows, fmt: str, download_name: str, stop: Optional[threading.Event] = None):
+    """
+    Builds a StreamingResponse from a generator that yields column names and then row batches.
+    The first item is pulled eagerly so query errors surface before any bytes are sent.
+    stop, if given, is set when the response ends, so a query polling it stops after a client disconnect.
+    """
+    if fmt not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {fmt}")
+    columns = next(rows)
+    body = export.encode(fmt, columns, rows)
+    return StreamingResponse(
+        body if stop is None else _set_when_done(body, stop),
+        media_type=export.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{download_name}.{fmt}"'},
+    )
+
+class RowsResponse(JSONResponse):
+    """
+    JSON response encoded by export.dumps_bytes (orjson when installed).
+    Handlers return it directly, which skips FastAPI's jsonable_encoder pass over every row.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return export.dumps_bytes(content)
+
+# Layouts accepted by ?layout= on endpoints that return rows: a dict per row,
+# or {"columns": [...], "rows": [[...], ...]}, which is smaller and faster to encode for wide tables
+ROW_LAYOUTS = ("objects", "columnar")
+
+def is_columnar(layout: str) -> bool:
+    if layout not in ROW_LAYOUTS:
+        raise HTTPException(status_code=400, detail=f"Unsupported row layout: {layout}")
+    return layout == "columnar"
+
+# Rows per "rows" event sent by /ask/stream
+STREAM_ASK_BATCH_SIZE = 100
+
+# Uploads are spooled here before they are imported (defaults to the system temp directory)
+IMPORT_SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR")
+
+# If set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>" (scrapers have no user JWT)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
 # OAuth2 scheme for token retrieval
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
     """
     Dependency to get the current authenticated user from the JWT token.
-    1. Decodes the token.
-    2. Validates the username.
-    3. Fetches user from DB.
+    1. Returns the cached user if this token was seen recently.
+    2. Decodes the token.
+    3. Validates the username.
+    4. Fetches user from DB and caches it until the token expires.
     """
+    cached = token_cache.get(token)
+    if cached is not MISSING:
+        return cached
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -72,13 +153,26 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Se
     user = crud.get_user_by_username(db, username=token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+    profile = schemas.UserProfile.model_validate(user)
+    # Never keep a token cached past its expiry
+    expires_at = payload.get("exp")
+    token_cache.set(token, profile, ttl_seconds=expires_at - time.time() if expires_at else None)
+    return profile
 
-@app.post("/register", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def password_pool_busy(e: auth.PasswordHasherBusy):
+    """429 response used when the password hashing pool is saturated."""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": "1"},
+    )
+
+@app.post("/register", response_model=schemas.UserProfile)
+async def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """
     Endpoint to register a new user.
     Checks if username or email already exists.
+    Password hashing runs on the bounded hashing pool.
     """
     db_user = crud.get_user_by_username(db, username=user.username)
     if db_user:
@@ -86,7 +180,13 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_email = crud.get_user_by_email(db, email=user.email)
     if db_email:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    # Return the users.db connection to the pool while bcrypt runs; the session reconnects for the insert
+    db.close()
+    try:
+        hashed_password = await auth.get_password_hash_async(user.password)
+    except auth.PasswordHasherBusy as e:
+        raise password_pool_busy(e)
+    return crud.create_user(db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/login", response_model=schemas.Token)
 async def login_for_access_token(
@@ -95,11 +195,17 @@ async def login_for_access_token(
 ):
     """
     Endpoint to login and get an access token.
-    Verifies username and password.
+    Verifies username and password on the bounded hashing pool.
     Returns JWT token.
     """
     user = crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    # Return the users.db connection to the pool while bcrypt runs (user keeps its loaded attributes)
+    db.close()
+    try:
+        valid = bool(user) and await auth.verify_password_async(form_data.password, user.hashed_password)
+    except auth.PasswordHasherBusy as e:
+        raise password_pool_busy(e)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -111,20 +217,126 @@ async def login_for_access_token(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.get("/users/me", response_model=schemas.User)
+@app.get("/users/me", response_model=schemas.UserProfile)
 async def read_users_me(
-    current_user: Annotated[schemas.User, Depends(get_current_user)]
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)]
 ):
     """
     Endpoint to get current user information.
     Requires authentication (valid JWT token).
+    Served from the token cache; use /users/me/databases for the user's databases.
     """
     return current_user
 
+@app.get("/users/me/databases", response_model=schemas.DatabasePage)
+def read_users_me_databases(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    include_total: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    One page of the current user's databases in id order.
+    Pass next_after_id from the previous page as after_id; include_total adds the overall count.
+    """
+    if limit < 1 or limit > 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    databases = crud.get_databases(db, user_id=current_user.id, limit=limit + 1, after_id=after_id)
+    next_after_id = databases[limit - 1].id if len(databases) > limit else None
+    total = crud.count_databases(db, user_id=current_user.id) if include_total else None
+    return schemas.DatabasePage(databases=databases[:limit], next_after_id=next_after_id, total=total)
+
+@app.get("/auth/stats")
+def read_auth_stats(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)]
+):
+    """
+    Queue depth, rejections and latency of the password hashing pool.
+    """
+    return auth.password_hasher.stats()
+
+@app.get("/ai/stats")
+def read_ai_stats(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)]
+):
+    """
+    Call, retry and coalescing counters of the LLM gateway.
+    """
+    return ai_agent.gateway.stats()
+
+@app.get("/db/stats")
+def read_db_stats(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)]
+):
+    """
+    Group-commit counters of the per-database writer queues.
+    """
+    return {"writers": dynamic_db.writers.stats()}
+
+def cache_stats():
+    return {
+        "tokens": token_cache.stats(),
+        "database_ownership": ownership_cache.stats(),
+        "schema_catalog": {"hits": dynamic_db.catalog.hits, "misses": dynamic_db.catalog.misses},
+        "ai_sql": ai_cache.sql_cache.stats(),
+        "ai_results": ai_cache.result_cache.stats(),
+        "schema_index": schema_context.index_cache.stats(),
+        "schema_context": schema_context.context_cache.stats(),
+        "table_stats": table_stats.stats_cache.stats(),
+    }
+
+@app.get("/cache/stats")
+def read_cache_stats(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)]
+):
+    """
+    Hit/miss counters for the in-process caches.
+    """
+    return cache_stats()
+
+def collect_metrics():
+    """Counters kept by the pool, caches, LLM gateway and writer queues, read at scrape time."""
+    caches = cache_stats()
+    yield "cache_hits_total", "counter", "Cache lookups that found an entry.", [
+        ({"cache": name}, stats["hits"]) for name, stats in caches.items()
+    ]
+    yield "cache_misses_total", "counter", "Cache lookups that found nothing.", [
+        ({"cache": name}, stats["misses"]) for name, stats in caches.items()
+    ]
+    yield "cache_hit_ratio", "gauge", "Hits over lookups since start.", [
+        ({"cache": name}, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0.0)
+        for name, stats in caches.items()
+    ]
+    yield "sqlite_connections_opened_total", "counter", "SQLite connections opened by the pool.", [({}, sqlite_pool.pool.opened)]
+    yield "sqlite_connection_checkouts_total", "counter", "Connections handed out by the pool, reused or new.", [
+        ({}, sqlite_pool.pool.checkouts)
+    ]
+    gateway = ai_agent.gateway.stats()
+    yield "llm_gateway_events_total", "counter", "LLM gateway calls, attempts, retries and failures.", [
+        ({"event": name}, value) for name, value in gateway.items() if name not in ("in_flight", "backend")
+    ]
+    yield "llm_in_flight", "gauge", "Distinct LLM calls currently running.", [({}, gateway["in_flight"])]
+    writers = dynamic_db.writers.stats()
+    yield "write_queue_depth", "gauge", "Single-row writes waiting for a writer thread.", [({}, writers["queued"])]
+    yield "write_groups_total", "counter", "Group commits made by the writer threads.", [({}, writers["groups"])]
+
+metrics.register_collector(collect_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics(request: Request):
+    """
+    Prometheus metrics: request latency per route, LLM, schema and SQL timers,
+    SQLite connection counts, cache hit ratios and rows returned per request.
+    """
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.post("/databases/", response_model=schemas.Database)
 def create_database(
     database: schemas.DatabaseCreate,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
@@ -134,63 +346,65 @@ def create_database(
 
 @app.get("/databases/", response_model=List[schemas.Database])
 def read_databases(
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     skip: int = 0,
     limit: int = 100,
+    after_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """
     List all databases for the current user.
+    Pass the last id seen as after_id to page without an offset.
     """
-    databases = crud.get_databases(db, user_id=current_user.id, skip=skip, limit=limit)
+    databases = crud.get_databases(db, user_id=current_user.id, skip=skip, limit=limit, after_id=after_id)
     return databases
 
 @app.get("/databases/{database_id}", response_model=schemas.Database)
 def read_database(
     database_id: int,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Get a specific database by ID.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if db_database is None:
         raise HTTPException(status_code=404, detail="Database not found")
     return db_database
 
 @app.get("/databases/{database_id}/tables", response_model=List[str])
-def list_tables(
+async def list_tables(
     database_id: int,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     List tables in a database.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
-    return dynamic_db.get_tables(db_database.filename)
+    return await async_db.call(dynamic_db.get_tables, db_database.filename)
 
 @app.post("/databases/{database_id}/tables")
-def create_table(
+async def create_table(
     database_id: int,
     table: schemas.TableCreate,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Create a new table in the database.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
         # Convert Pydantic models to dicts for dynamic_db
         columns = [{"name": c.name, "type": c.type} for c in table.columns]
-        dynamic_db.create_table(db_database.filename, table.name, columns)
+        await async_db.call(dynamic_db.create_table, db_database.filename, table.name, columns, stable_ids=table.stable_ids)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -198,165 +412,532 @@ def create_table(
     return {"message": "Table created"}
 
 @app.delete("/databases/{database_id}/tables/{table_name}")
-def drop_table(
+async def drop_table(
     database_id: int,
     table_name: str,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Drop a table from the database.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        dynamic_db.drop_table(db_database.filename, table_name)
+        await async_db.call(dynamic_db.drop_table, db_database.filename, table_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Table dropped"}
 
+@app.get("/databases/{database_id}/tables/{table_name}/options", response_model=schemas.TableOptions)
+async def get_table_options(
+    database_id: int,
+    table_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Get the options of a table.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(dynamic_db.get_table_options, db_database.filename, table_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.put("/databases/{database_id}/tables/{table_name}/options", response_model=schemas.TableOptions)
+async def update_table_options(
+    database_id: int,
+    table_name: str,
+    options: schemas.TableOptions,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Update the options of a table (e.g. switch an older table to stable ids).
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        await async_db.call(dynamic_db.set_stable_ids, db_database.filename, table_name, options.stable_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return options
+
+@app.get("/databases/{database_id}/tables/{table_name}/indexes", response_model=List[schemas.IndexInfo])
+async def get_indexes(
+    database_id: int,
+    table_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    List the indexes of a table.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(dynamic_db.get_indexes, db_database.filename, table_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/databases/{database_id}/tables/{table_name}/indexes", response_model=schemas.IndexInfo)
+async def create_index(
+    database_id: int,
+    table_name: str,
+    index: schemas.IndexCreate,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Create a single- or multi-column index, optionally unique.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(
+            dynamic_db.create_index, db_database.filename, table_name, index.columns, index.unique, index.name
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/databases/{database_id}/tables/{table_name}/indexes/{index_name}")
+async def drop_index(
+    database_id: int,
+    table_name: str,
+    index_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Drop an index of a table.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        await async_db.call(dynamic_db.drop_index, db_database.filename, table_name, index_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Index dropped"}
+
+@app.get("/databases/{database_id}/indexes/suggestions", response_model=List[schemas.IndexSuggestion])
+async def get_index_suggestions(
+    database_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Indexes suggested by the columns that /ask queries filter on without an index.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    return await async_db.call(index_advisor.get_suggestions, db_database.filename)
+
+@app.post("/databases/{database_id}/indexes/suggestions/apply", response_model=List[schemas.IndexInfo])
+async def apply_index_suggestions(
+    database_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Create every suggested index.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    return await async_db.call(index_advisor.apply_suggestions, db_database.filename)
+
 @app.get("/databases/{database_id}/tables/{table_name}/columns")
-def get_columns(
+async def get_columns(
     database_id: int,
     table_name: str,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Get columns of a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        return dynamic_db.get_columns(db_database.filename, table_name)
+        return await async_db.call(dynamic_db.get_columns, db_database.filename, table_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/databases/{database_id}/tables/{table_name}/columns")
-def add_column(
+async def add_column(
     database_id: int,
     table_name: str,
     column: schemas.ColumnDefinition,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Add a column to a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        dynamic_db.add_column(db_database.filename, table_name, column.name, column.type)
+        await async_db.call(dynamic_db.add_column, db_database.filename, table_name, column.name, column.type)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Column added"}
 
 @app.delete("/databases/{database_id}/tables/{table_name}/columns/{column_name}")
-def drop_column(
+async def drop_column(
     database_id: int,
     table_name: str,
     column_name: str,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Drop a column from a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        dynamic_db.drop_column(db_database.filename, table_name, column_name)
+        await async_db.call(dynamic_db.drop_column, db_database.filename, table_name, column_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"message": "Column dropped"}
 
 @app.get("/databases/{database_id}/tables/{table_name}/rows")
-def get_rows(
+async def get_rows(
     database_id: int,
     table_name: str,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    row_numbers: bool = False,
+    layout: str = "objects",
     db: Session = Depends(get_db)
 ):
     """
     Get rows of a table.
+    Set row_numbers to add a consecutive 'row_number' for display.
+    layout=columnar returns {"columns": [...], "rows": [[...], ...]} instead of a list of objects.
+    """
+    columnar = is_columnar(layout)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        rows = await async_db.call(dynamic_db.get_rows, db_database.filename, table_name, row_numbers=row_numbers, columnar=columnar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metrics.record_rows(len(rows["rows"] if columnar else rows))
+    return RowsResponse(rows)
+
+@app.post("/databases/{database_id}/tables/{table_name}/rows/query", response_model=schemas.RowPage)
+async def query_rows(
+    database_id: int,
+    table_name: str,
+    query: schemas.RowQuery,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    layout: str = "objects",
+    db: Session = Depends(get_db)
+):
+    """
+    Get one page of rows of a table.
+    Supports column projection, sorting, filters and cursor-based pagination.
+    layout=columnar returns the page's rows as arrays in the order of an added "columns" list.
+    """
+    columnar = is_columnar(layout)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        page = await async_db.call(
+            dynamic_db.query_rows,
+            db_database.filename,
+            table_name,
+            limit=query.limit,
+            cursor=query.cursor,
+            columns=query.columns,
+            order_by=query.order_by,
+            descending=query.descending,
+            filters=[f.model_dump() for f in query.filters],
+            columnar=columnar,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metrics.record_rows(len(page["rows"]))
+    return RowsResponse(page)
+
+@app.get("/databases/{database_id}/tables/{table_name}/stats", response_model=schemas.TableStats)
+async def get_table_stats(
+    database_id: int,
+    table_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Row count and per-column null count, min, max, average and distinct count.
+    Cached until the database's data changes.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(table_stats.get_table_stats, db_database.filename, table_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/databases/{database_id}/tables/{table_name}/columns/{column_name}/groups", response_model=List[schemas.ValueCount])
+async def get_group_counts(
+    database_id: int,
+    table_name: str,
+    column_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Row counts per value of a column, most frequent first.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(table_stats.get_group_counts, db_database.filename, table_name, column_name, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/databases/{database_id}/tables/{table_name}/columns/{column_name}/values", response_model=List[Any])
+async def get_distinct_values(
+    database_id: int,
+    table_name: str,
+    column_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    prefix: str = "",
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Sorted distinct values of a column, optionally only those starting with prefix.
+    Meant for dropdowns and autocompletion without loading the whole table.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        return await async_db.call(
+            table_stats.get_distinct_values, db_database.filename, table_name, column_name, prefix, limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/databases/{database_id}/tables/{table_name}/import", status_code=202, response_model=schemas.Job)
+async def import_rows(
+    database_id: int,
+    table_name: str,
+    request: Request,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    format: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    Upload a CSV or NDJSON file as the raw request body and load it into a table, creating the table if needed.
+    The format comes from ?format= or the Content-Type header. The import runs as a background job;
+    poll GET /jobs/{job_id} for progress.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    if not table_name.isidentifier():
+        raise HTTPException(status_code=400, detail="Invalid table name")
+
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = next((fmt for fmt, media in importer.IMPORT_FORMATS.items() if media == content_type), None)
+    if format not in importer.IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported import format: {format}")
+
+    # Spool the body to disk as it arrives so memory use stays flat for large files
+    with tempfile.NamedTemporaryFile(dir=IMPORT_SPOOL_DIR, suffix=f".{format}", delete=False) as spool:
+        try:
+            async for chunk in request.stream():
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            os.remove(spool.name)
+            raise
+
+    try:
+        return await jobs.manager.submit(
+            db, current_user.id, database_id, "import", {"table": table_name, "format": format}, input_path=spool.name
+        )
+    except jobs.JobQueueFull as e:
+        os.remove(spool.name)
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/databases/{database_id}/tables/{table_name}/export")
+def export_table(
+    database_id: int,
+    table_name: str,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    format: str = "csv",
+    db: Session = Depends(get_db)
+):
+    """
+    Stream every row of a table as CSV, NDJSON or a JSON array.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        return dynamic_db.get_rows(db_database.filename, table_name)
+        rows = dynamic_db.iter_table_rows(db_database.filename, table_name)
+        return stream_export(rows, format, table_name)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/databases/{database_id}/tables/{table_name}/rows")
-def add_row(
+async def add_row(
     database_id: int,
     table_name: str,
     row: schemas.RowCreate,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Add a row to a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        row_id = dynamic_db.add_row(db_database.filename, table_name, row.data)
+        row_id = await async_db.write(dynamic_db.submit_add_row, db_database.filename, table_name, row.data)
         return {"id": row_id}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.IntegrityError as e:
+        # e.g. a unique index rejected the value
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/databases/{database_id}/tables/{table_name}/rows/batch", response_model=schemas.RowBatchResponse)
+async def apply_row_batch(
+    database_id: int,
+    table_name: str,
+    batch: schemas.RowBatch,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Insert, update or delete many rows in one request.
+    'rows' are inserted first, followed by 'operations' in order.
+    Returns the id or error for each row.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    operations = [{"op": "insert", "data": data} for data in batch.rows]
+    operations += [op.model_dump() for op in batch.operations]
+    try:
+        results = await async_db.call(dynamic_db.apply_row_batch, db_database.filename, table_name, operations, batch.chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    failed = sum(1 for r in results if r["error"])
+    return {"results": results, "succeeded": len(results) - failed, "failed": failed}
+
+@app.post("/databases/{database_id}/tables/{table_name}/rows/delete")
+async def delete_rows(
+    database_id: int,
+    table_name: str,
+    delete_req: schemas.RowDeleteRequest,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a list of rows or an id range from a table.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+    
+    try:
+        deleted = await async_db.call(
+            dynamic_db.delete_rows,
+            db_database.filename,
+            table_name,
+            ids=delete_req.ids,
+            start_id=delete_req.start_id,
+            end_id=delete_req.end_id,
+        )
+        return {"deleted": deleted}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/databases/{database_id}/tables/{table_name}/rows/{row_id}")
-def update_row(
+async def update_row(
     database_id: int,
     table_name: str,
     row_id: int,
     row: schemas.RowCreate,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Update a row in a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        dynamic_db.update_row(db_database.filename, table_name, row_id, row.data)
+        await async_db.write(dynamic_db.submit_update_row, db_database.filename, table_name, row_id, row.data)
         return {"message": "Row updated"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.IntegrityError as e:
+        # e.g. a unique index rejected the value
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/databases/{database_id}/tables/{table_name}/rows/{row_id}")
-def delete_row(
+async def delete_row(
     database_id: int,
     table_name: str,
     row_id: int,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
     Delete a row from a table.
     """
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
     try:
-        dynamic_db.delete_row(db_database.filename, table_name, row_id)
+        await async_db.write(dynamic_db.submit_delete_row, db_database.filename, table_name, row_id)
         return {"message": "Row deleted"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -364,7 +945,7 @@ def delete_row(
 @app.delete("/databases/{database_id}", response_model=bool)
 def delete_database(
     database_id: int,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
     db: Session = Depends(get_db)
 ):
     """
@@ -379,34 +960,62 @@ def delete_database(
 async def ask_ai_database_question(
     database_id: int,
     query_req: schemas.AIQueryRequest,
-    current_user: Annotated[schemas.User, Depends(get_current_user)],
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    layout: str = "objects",
     db: Session = Depends(get_db)
 ):
     """
     Takes a natural language question, generates SQL, and returns the data.
+    layout=columnar returns "columns" and "rows" (arrays) instead of "results" (objects).
     """
+    columnar = is_columnar(layout)
     # 1. Verify database ownership
-    db_database = crud.get_database(db, database_id=database_id, user_id=current_user.id)
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
     if not db_database:
         raise HTTPException(status_code=404, detail="Database not found")
     
+    filename = db_database.filename
     generated_sql = ""
         
     try:
-        # 2. Extract context
-        schema_context = ai_agent.get_database_schema(db_database.filename)
+        # 2. Extract context (off the event loop)
+        schema = await async_db.call(dynamic_db.get_schema, filename)
         
-        # 3. Generate SQL asynchronously
-        generated_sql = await ai_agent.generate_sql(schema_context, query_req.question)
+        # 3. Generate SQL asynchronously, unless this question was answered for the same schema
+        cached_sql = ai_cache.get_sql(filename, schema.fingerprint, query_req.question)
+        sql_cached = cached_sql is not None
+        if sql_cached:
+            generated_sql = cached_sql
+        else:
+            context = await async_db.call(ai_agent.get_schema_context, filename, query_req.question)
+            generated_sql = await ai_agent.generate_sql(context, query_req.question)
         
-        # 4. Execute safely
-        results = ai_agent.execute_read_only_sql(db_database.filename, generated_sql)
+        # 4. Execute safely (off the event loop), unless the data hasn't changed since the last run
+        data_version = dynamic_db.get_data_version(filename)
+        execution = ai_cache.get_results(filename, generated_sql, data_version)
+        results_cached = execution is not None
+        if not results_cached:
+            execution = await async_db.call(ai_agent.execute_read_only_sql, filename, generated_sql)
+            ai_cache.put_results(filename, generated_sql, data_version, execution)
+            await jobs.queue_index_suggestions(current_user.id, database_id, filename)
+        if not sql_cached:
+            ai_cache.put_sql(filename, schema.fingerprint, query_req.question, generated_sql)
         
-        return schemas.AIQueryResponse(
-            sql_query=generated_sql,
-            results=results,
-            error=None
-        )
+        metrics.record_rows(len(execution["rows"]))
+        response = {
+            "sql_query": generated_sql,
+            "error": None,
+            "sql_cached": sql_cached,
+            "results_cached": results_cached,
+            "truncated": execution["truncated"],
+            "elapsed_ms": execution["elapsed_ms"],
+            "rows_scanned": execution["rows_scanned"],
+        }
+        if columnar:
+            response.update(results=None, columns=execution["columns"], rows=execution["rows"])
+        else:
+            response.update(results=ai_agent.result_dicts(execution), columns=None, rows=None)
+        return RowsResponse(response)
         
     except ValueError as e:
         # Catch security violations (e.g., non-SELECT queries)
@@ -414,3 +1023,232 @@ async def ask_ai_database_question(
     except Exception as e:
         # Catch SQL syntax errors hallucinated by the LLM
         return schemas.AIQueryResponse(sql_query=generated_sql, error=f"Database execution failed: {str(e)}")
+
+async def stream_ask_events(user_id: int, database_id: int, filename: str, question: str):
+    """
+    Runs the /ask pipeline and yields Server-Sent Events as each stage produces output:
+    sql_token* -> sql -> query_started -> rows* -> done, or an error event at any point.
+    """
+    generated_sql = ""
+    rows = None
+    try:
+        schema = await async_db.call(dynamic_db.get_schema, filename)
+
+        cached_sql = ai_cache.get_sql(filename, schema.fingerprint, question)
+        sql_cached = cached_sql is not None
+        if sql_cached:
+            generated_sql = cached_sql
+        else:
+            context = await async_db.call(ai_agent.get_schema_context, filename, question)
+            parts = []
+            async for chunk in ai_agent.stream_sql(context, question):
+                parts.append(chunk)
+                yield export.sse_event("sql_token", {"text": chunk})
+            generated_sql = ai_agent.clean_sql("".join(parts))
+        yield export.sse_event("sql", {"sql_query": generated_sql, "sql_cached": sql_cached})
+
+        data_version = dynamic_db.get_data_version(filename)
+        execution = ai_cache.get_results(filename, generated_sql, data_version)
+        if execution is not None:
+            yield export.sse_event("query_started", {"columns": execution["columns"], "rows_scanned": execution["rows_scanned"], "results_cached": True})
+            if execution["rows"]:
+                yield export.sse_event("rows", {"rows": ai_agent.result_dicts(execution)})
+            metrics.record_rows(len(execution["rows"]))
+            yield export.sse_event("done", {"row_count": len(execution["rows"]), "truncated": execution["truncated"], "elapsed_ms": execution["elapsed_ms"]})
+        else:
+            # Pull batches from the cursor on the database executor, one at a time
+            start = time.perf_counter()
+            info = {}
+            rows = ai_agent.iter_read_only_sql(filename, generated_sql, batch_size=STREAM_ASK_BATCH_SIZE, limited=True, info=info)
+            columns = await async_db.executor.run(filename, next, rows)
+            yield export.sse_event("query_started", {"columns": columns, "rows_scanned": info["rows_scanned"], "results_cached": False})
+            results = []
+            while True:
+                batch = await async_db.executor.run(filename, next, rows, None)
+                if batch is None:
+                    break
+                results.extend(batch)
+                yield export.sse_event("rows", {"rows": [dict(zip(columns, row)) for row in batch]})
+            execution = {
+                "columns": columns,
+                "rows": results,
+                "truncated": info["truncated"],
+                "elapsed_ms": (time.perf_counter() - start) * 1000,
+                "rows_scanned": info["rows_scanned"],
+            }
+            ai_cache.put_results(filename, generated_sql, data_version, execution)
+            await jobs.queue_index_suggestions(user_id, database_id, filename)
+            metrics.record_rows(len(results))
+            yield export.sse_event("done", {"row_count": len(results), "truncated": execution["truncated"], "elapsed_ms": execution["elapsed_ms"]})
+        if not sql_cached:
+            ai_cache.put_sql(filename, schema.fingerprint, question, generated_sql)
+
+    except ValueError as e:
+        yield export.sse_event("error", {"sql_query": generated_sql, "error": str(e)})
+    except Exception as e:
+        yield export.sse_event("error", {"sql_query": generated_sql, "error": f"Database execution failed: {str(e)}"})
+    finally:
+        if rows is not None:
+            try:
+                rows.close()
+            except ValueError:
+                # Still running on a worker after a client disconnect; it is closed when collected
+                pass
+
+@app.post("/databases/{database_id}/ask/stream")
+def ask_ai_database_question_stream(
+    database_id: int,
+    query_req: schemas.AIQueryRequest,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Streaming variant of /ask using Server-Sent Events.
+    Sends the SQL as the model writes it, then a query_started event, then the result rows in batches.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+
+    return StreamingResponse(
+        stream_ask_events(current_user.id, database_id, db_database.filename, query_req.question),
+        media_type="text/event-stream",
+        # Ask proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/databases/{database_id}/ask/export")
+def export_ai_query(
+    database_id: int,
+    export_req: schemas.AIExportRequest,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    format: str = "csv",
+    db: Session = Depends(get_db)
+):
+    """
+    Re-run the SQL returned by /ask and stream the full result set as CSV, NDJSON or a JSON array.
+    The query stops after AI_EXPORT_TIMEOUT_SECONDS or when the client disconnects.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+
+    stop = threading.Event()
+    try:
+        rows = ai_agent.iter_read_only_sql(
+            db_database.filename,
+            export_req.sql_query,
+            should_stop=stop.is_set,
+            timeout_seconds=ai_agent.AI_EXPORT_TIMEOUT_SECONDS,
+        )
+        return stream_export(rows, format, "query_results", stop)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.Error as e:
+        raise HTTPException(status_code=400, detail=f"Database execution failed: {str(e)}")
+
+@app.post("/databases/{database_id}/jobs", status_code=202, response_model=schemas.Job)
+async def submit_job(
+    database_id: int,
+    job: schemas.JobCreate,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Queue a long-running operation (export, vacuum, drop_column or ask) as a background job.
+    """
+    db_database = crud.get_owned_database(db, database_id=database_id, user_id=current_user.id)
+    if not db_database:
+        raise HTTPException(status_code=404, detail="Database not found")
+
+    try:
+        jobs.validate_params(job.kind, job.params)
+        return await jobs.manager.submit(db, current_user.id, database_id, job.kind, job.params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except jobs.JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/jobs", response_model=List[schemas.Job])
+def read_jobs(
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    List the current user's jobs, newest first.
+    """
+    return crud.get_jobs(db, user_id=current_user.id, status=status, skip=skip, limit=limit)
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(
+    job_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Status and progress of a job.
+    """
+    db_job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.Job)
+async def cancel_job(
+    job_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel a queued or running job. Running jobs stop at their next checkpoint;
+    a drop_column job can only be cancelled while it is queued.
+    """
+    db_job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status in jobs.FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {db_job.status}")
+    try:
+        return await jobs.manager.cancel(db, db_job)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/jobs/{job_id}/result")
+def read_job_result(
+    job_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Result of a completed job: the file for exports, JSON for everything else.
+    """
+    db_job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {db_job.status}")
+    if db_job.result_path:
+        fmt = db_job.result["format"]
+        return FileResponse(db_job.result_path, media_type=export.EXPORT_FORMATS[fmt], filename=f"job_{db_job.id}.{fmt}")
+    return db_job.result
+
+@app.delete("/jobs/{job_id}")
+def delete_job(
+    job_id: int,
+    current_user: Annotated[schemas.UserProfile, Depends(get_current_user)],
+    db: Session = Depends(get_db)
+):
+    """
+    Delete a finished job and its result file.
+    """
+    db_job = crud.get_job(db, job_id=job_id, user_id=current_user.id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status not in jobs.FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail="Cancel the job before deleting it")
+    jobs.manager.discard_files(db_job)
+    crud.delete_job(db, db_job)
+    return True
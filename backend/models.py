@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, JSON
+from datetime import datetime, timezone
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, ForeignKey, Index, JSON
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -23,8 +24,8 @@ class User(Base):
     # User status
     is_active = Column(Boolean, default=True)
 
-    # Relationship to user's databases
-    databases = relationship("Database", back_populates="owner")
+    # Relationship to user's databases. Never loaded implicitly: use crud.get_databases, which pages
+    databases = relationship("Database", back_populates="owner", lazy="raise_on_sql")
 
 class Database(Base):
     """
@@ -38,3 +39,33 @@ class Database(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="databases")
+
+    # Listing a user's databases in id order is an index range scan
+    __table_args__ = (Index("ix_databases_owner_id_id", "owner_id", "id"),)
+
+class Job(Base):
+    """
+    SQLAlchemy model for background jobs (imports, exports, VACUUM, slow /ask queries).
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    database_id = Column(Integer, ForeignKey("databases.id"))
+    kind = Column(String) # import, export, vacuum, drop_column, ask
+    status = Column(String, default="queued") # queued, running, completed, failed, cancelled
+    params = Column(JSON, default=dict)
+    progress = Column(JSON, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+
+    # Uploaded input (imports) and produced output (exports), kept out of the API responses
+    input_path = Column(String, nullable=True)
+    result_path = Column(String, nullable=True)
+
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Per-user limits count a user's unfinished jobs
+    __table_args__ = (Index("ix_jobs_owner_status", "owner_id", "status"),)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import metrics
+import sqlite_pool
+
+
+class SchemaSnapshot:
+    """Tables and columns of one database at a given PRAGMA schema_version."""
+
+    def __init__(self, version: int, tables: Dict[str, List[Dict[str, Any]]]):
+        self.version = version
+        # Table name -> list of {'name', 'type', 'pk'} in column order. Treat as read-only.
+        self.tables = tables
+        # Stable digest of the table/column layout, comparable across processes and restarts
+        self.fingerprint = hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class SchemaCatalog:
+    """
+    In-process cache of table/column metadata keyed by (database file, schema_version).
+    Entries are dropped explicitly after DDL and are also refreshed whenever
+    SQLite reports a different schema_version (e.g. a change made by another process).
+    """
+
+    def __init__(self, hidden_tables: Iterable[str] = ()):
+        # Internal tables that are never reported
+        self.hidden_tables = set(hidden_tables)
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, SchemaSnapshot] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, conn: sqlite3.Connection, version: int) -> SchemaSnapshot:
+        """Reads every table and its columns in a single query."""
+        cursor = conn.execute(
+            "SELECT m.name, p.name, p.type, p.pk "
+            "FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p "
+            "WHERE m.type = 'table' ORDER BY m.rowid, p.cid;"
+        )
+        tables: Dict[str, List[Dict[str, Any]]] = {}
+        for table_name, col_name, col_type, pk in cursor.fetchall():
+            if table_name in self.hidden_tables:
+                continue
+            tables.setdefault(table_name, []).append({"name": col_name, "type": col_type, "pk": bool(pk)})
+        return SchemaSnapshot(version, tables)
+
+    def get(self, filepath: str, conn: Optional[sqlite3.Connection] = None) -> SchemaSnapshot:
+        """
+        Returns the current schema of a database file.
+        Pass conn to reuse a connection that is already checked out.
+        """
+        if conn is None:
+            with sqlite_pool.connection(filepath) as pooled:
+                return self.get(filepath, pooled)
+
+        version = conn.execute("PRAGMA schema_version;").fetchone()[0]
+        with self._lock:
+            snapshot = self._snapshots.get(filepath)
+            if snapshot is not None and snapshot.version == version:
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+
+        with metrics.schema_seconds.time(step="catalog"):
+            snapshot = self._load(conn, version)
+        with self._lock:
+            self._snapshots[filepath] = snapshot
+        return snapshot
+
+    def invalidate(self, filepath: str):
+        """Drops the cached schema of a database file."""
+        with self._lock:
+            self._snapshots.pop(filepath, None)
+
@@ -0,0 +1,214 @@
+import os
+import re
+import sqlite3
+from typing import Dict, List, Optional, Set
+
+import sqlite_pool
+from cache import MISSING, TTLCache
+from schema_catalog import SchemaSnapshot
+
+# Rough token budget for the schema part of the system prompt (about 4 characters per token)
+SCHEMA_CONTEXT_MAX_TOKENS = int(os.getenv("SCHEMA_CONTEXT_MAX_TOKENS", "1500"))
+# Distinct values sampled per text column for matching literals in the question
+SCHEMA_SAMPLE_VALUES = int(os.getenv("SCHEMA_SAMPLE_VALUES", "20"))
+# Longer values are not sampled (they are rarely quoted in questions)
+SCHEMA_SAMPLE_MAX_LENGTH = 40
+SCHEMA_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("SCHEMA_CONTEXT_CACHE_MAX_ENTRIES", "2000"))
+SCHEMA_CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("SCHEMA_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+
+# Match weights: a table named in the question matters more than one of its columns or values
+TABLE_WEIGHT = 3
+COLUMN_WEIGHT = 2
+VALUE_WEIGHT = 1
+
+# (filepath, schema_version) -> SchemaIndex
+index_cache = TTLCache(256, SCHEMA_CONTEXT_CACHE_TTL_SECONDS)
+# (filepath, schema_version, question class) -> context string
+context_cache = TTLCache(SCHEMA_CONTEXT_CACHE_MAX_ENTRIES, SCHEMA_CONTEXT_CACHE_TTL_SECONDS)
+
+
+def tokenize(text: str) -> Set[str]:
+    """Splits text into lowercase word tokens, breaking snake_case and camelCase and dropping plural 's'."""
+    text = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", text)
+    tokens = set()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        tokens.add(word)
+        if len(word) > 3 and word.endswith("s"):
+            tokens.add(word[:-1])
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def format_table(table_name: str, columns: List[Dict], samples: Optional[Dict[str, List[str]]] = None) -> str:
+    """One prompt line per table, optionally followed by example values of some columns."""
+    col_defs = [f"{col['name']} ({col['type']}{' PK' if col['pk'] else ''})" for col in columns]
+    line = f"Table '{table_name}': {', '.join(col_defs)}\n"
+    for col_name, values in (samples or {}).items():
+        line += f"  {col_name} values include: {', '.join(repr(v) for v in values)}\n"
+    return line
+
+
+class SchemaIndex:
+    """
+    Compact per-table prompt lines plus a lexical index over table names, column names
+    and sampled text values, for one schema version of a database.
+    """
+
+    def __init__(self, snapshot: SchemaSnapshot, samples: Dict[str, Dict[str, List[str]]]):
+        self.version = snapshot.version
+        # SQLite's own bookkeeping tables are of no use to the model
+        self.tables = {t: cols for t, cols in snapshot.tables.items() if not t.startswith("sqlite_")}
+        self.samples = samples
+        self.lines = {table: format_table(table, columns) for table, columns in self.tables.items()}
+        self.total_tokens = sum(estimate_tokens(line) for line in self.lines.values())
+        # token -> {table: weight}
+        self.postings: Dict[str, Dict[str, int]] = {}
+        # (table, token) -> columns whose sampled values contain the token
+        self.value_columns: Dict[tuple, Set[str]] = {}
+        for table, columns in self.tables.items():
+            self._add(tokenize(table), table, TABLE_WEIGHT)
+            for col in columns:
+                self._add(tokenize(col["name"]), table, COLUMN_WEIGHT)
+            for col_name, values in samples.get(table, {}).items():
+                for value in values:
+                    value_tokens = tokenize(value)
+                    self._add(value_tokens, table, VALUE_WEIGHT)
+                    for token in value_tokens:
+                        self.value_columns.setdefault((table, token), set()).add(col_name)
+
+    def _add(self, tokens: Set[str], table: str, weight: int):
+        for token in tokens:
+            entry = self.postings.setdefault(token, {})
+            entry[table] = max(entry.get(table, 0), weight)
+
+    def question_class(self, question: str) -> tuple:
+        """The schema terms a question mentions; questions with the same terms get the same context."""
+        return tuple(sorted(tokenize(question) & self.postings.keys()))
+
+    def score(self, terms: tuple) -> Dict[str, int]:
+        scores: Dict[str, int] = {}
+        for token in terms:
+            for table, weight in self.postings[token].items():
+                scores[table] = scores.get(table, 0) + weight
+        return scores
+
+    def _neighbours(self, table: str) -> List[str]:
+        """Tables referenced by <name>_id columns, which the model will likely need for joins."""
+        found = []
+        for col in self.tables[table]:
+            match = re.match(r"(\w+?)_?id$", col["name"], re.IGNORECASE)
+            if not match or not match.group(1):
+                continue
+            stem = match.group(1).lower()
+            for candidate in self.tables:
+                if candidate != table and candidate.lower() in (stem, stem + "s", stem + "es"):
+                    found.append(candidate)
+        return found
+
+    def build(self, terms: tuple, max_tokens: int = SCHEMA_CONTEXT_MAX_TOKENS) -> str:
+        """
+        Builds the schema context for a question class.
+        Small schemas are returned whole; larger ones keep the best-matching tables
+        (and the tables they reference) until max_tokens is reached.
+        """
+        context = "Database Schema:\n"
+        if self.total_tokens <= max_tokens:
+            return context + "".join(self.lines.values())
+
+        scores = self.score(terms)
+        ranked = sorted(scores, key=lambda t: -scores[t])
+        ordered = []
+        for table in ranked:
+            ordered.append(table)
+            ordered.extend(self._neighbours(table))
+        if not ordered:
+            # Nothing in the question points at a table: show as much of the schema as fits
+            ordered = list(self.tables)
+
+        budget = max_tokens - estimate_tokens(context)
+        chosen = []
+        for table in dict.fromkeys(ordered):
+            line = format_table(table, self.tables[table], self._matched_samples(table, terms))
+            cost = estimate_tokens(line)
+            if cost > budget:
+                continue
+            chosen.append(table)
+            context += line
+            budget -= cost
+
+        # List the remaining table names so the model knows they exist
+        omitted = []
+        for table in self.tables:
+            if table in chosen:
+                continue
+            budget -= estimate_tokens(table + ", ")
+            if budget < 10:
+                break
+            omitted.append(table)
+        if omitted:
+            context += f"Other tables (columns not shown): {', '.join(omitted)}\n"
+        return context
+
+    def _matched_samples(self, table: str, terms: tuple) -> Dict[str, List[str]]:
+        """Sampled values of the columns whose values the question mentions, so the model can quote them exactly."""
+        columns = set()
+        for token in terms:
+            columns |= self.value_columns.get((table, token), set())
+        return {col: self.samples[table][col] for col in sorted(columns)}
+
+
+def _sample_values(conn: sqlite3.Connection, snapshot: SchemaSnapshot) -> Dict[str, Dict[str, List[str]]]:
+    """Reads a few distinct short values from every text column."""
+    samples: Dict[str, Dict[str, List[str]]] = {}
+    for table, columns in snapshot.tables.items():
+        if table.startswith("sqlite_"):
+            continue
+        for col in columns:
+            if "TEXT" not in (col["type"] or "").upper() and "CHAR" not in (col["type"] or "").upper():
+                continue
+            try:
+                rows = conn.execute(
+                    f'SELECT DISTINCT "{col["name"]}" FROM "{table}" '
+                    f'WHERE "{col["name"]}" IS NOT NULL AND length("{col["name"]}") <= ? LIMIT ?;',
+                    (SCHEMA_SAMPLE_MAX_LENGTH, SCHEMA_SAMPLE_VALUES),
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            if rows:
+                samples.setdefault(table, {})[col["name"]] = [str(row[0]) for row in rows]
+    return samples
+
+
+def get_index(filepath: str, snapshot: SchemaSnapshot) -> SchemaIndex:
+    """
+    Returns the lexical index for a schema version, building it on first use.
+    Sampled values are refreshed when the schema changes or the entry expires.
+    """
+    key = (filepath, snapshot.version)
+    index = index_cache.get(key)
+    if index is MISSING:
+        with sqlite_pool.connection(filepath, readonly=True) as conn:
+            index = SchemaIndex(snapshot, _sample_values(conn, snapshot))
+        index_cache.set(key, index)
+    return index
+
+
+def build_context(filepath: str, snapshot: SchemaSnapshot, question: str) -> str:
+    """Returns the pruned schema context for a question, cached per (schema version, question class)."""
+    index = get_index(filepath, snapshot)
+    terms = index.question_class(question)
+    key = (filepath, snapshot.version, terms)
+    context = context_cache.get(key)
+    if context is MISSING:
+        context = index.build(terms)
+        context_cache.set(key, context)
+    return context
+
+
+def forget_database(filepath: str):
+    """Drops the index and cached contexts of a deleted database."""
+    index_cache.discard_matching(lambda key, _: key[0] == filepath)
+    context_cache.discard_matching(lambda key, _: key[0] == filepath)
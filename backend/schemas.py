@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Any, Dict
+from datetime import datetime
+from typing import Optional, List, Any, Dict, Union
 
 # Schemas for Dynamic DB Structure
 
@@ -10,10 +11,92 @@ class ColumnDefinition(BaseModel):
 class TableCreate(BaseModel):
     name: str
     columns: List[ColumnDefinition]
+    stable_ids: bool = True # Keep ids unchanged on delete instead of renumbering
+
+class TableOptions(BaseModel):
+    stable_ids: bool
+
+class IndexCreate(BaseModel):
+    columns: List[str] # Indexed columns, in order
+    unique: bool = False
+    name: Optional[str] = None # Defaults to idx_<table>_<columns>
+
+class IndexInfo(BaseModel):
+    name: str
+    columns: List[str]
+    unique: bool
+
+class IndexSuggestion(BaseModel):
+    table: str
+    columns: List[str]
+    hits: int # /ask queries that filtered on these columns with a full table scan
+    estimated_rows: int
 
 class RowCreate(BaseModel):
     data: Dict[str, Any]
 
+class RowOperation(BaseModel):
+    op: str = "insert" # insert, update, delete
+    id: Optional[int] = None # Required for update and delete
+    data: Dict[str, Any] = {}
+
+class RowBatch(BaseModel):
+    rows: List[Dict[str, Any]] = [] # Shorthand for insert operations
+    operations: List[RowOperation] = []
+    chunk_size: int = 500 # Operations committed per transaction
+
+class RowBatchResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class RowBatchResponse(BaseModel):
+    results: List[RowBatchResult]
+    succeeded: int
+    failed: int
+
+class RowDeleteRequest(BaseModel):
+    ids: Optional[List[int]] = None
+    start_id: Optional[int] = None # Inclusive range, used when ids is not given
+    end_id: Optional[int] = None
+
+class RowFilter(BaseModel):
+    column: str
+    op: str = "eq" # eq, ne, lt, lte, gt, gte, like, in, is_null
+    value: Any = None
+
+class RowQuery(BaseModel):
+    limit: int = 100
+    cursor: Optional[str] = None # next_cursor from the previous page
+    columns: Optional[List[str]] = None # Defaults to all columns
+    order_by: str = "id"
+    descending: bool = False
+    filters: List[RowFilter] = []
+
+class RowPage(BaseModel):
+    columns: Optional[List[str]] = None # Only with layout=columnar, where each row is an array in this order
+    rows: List[Union[Dict[str, Any], List[Any]]]
+    next_cursor: Optional[str] = None
+
+class ColumnStats(BaseModel):
+    name: str
+    type: Optional[str] = None
+    null_count: int
+    min: Any = None
+    max: Any = None
+    avg: Optional[float] = None # Numeric columns only
+    distinct: int
+
+class TableStats(BaseModel):
+    table: str
+    row_count: int
+    distinct_estimated: bool # Distinct counts were estimated from a random sample of a large table
+    columns: List[ColumnStats]
+
+class ValueCount(BaseModel):
+    value: Any = None
+    count: int
+
 class TableSchema(BaseModel):
     name: str
 
@@ -37,6 +120,30 @@ class Database(DatabaseBase):
     class Config:
         from_attributes = True
 
+class DatabasePage(BaseModel):
+    databases: List[Database]
+    next_after_id: Optional[int] = None # Pass as after_id to get the next page; None on the last page
+    total: Optional[int] = None # Only with include_total
+
+class JobCreate(BaseModel):
+    kind: str # export, vacuum, drop_column, ask, apply_indexes
+    params: Dict[str, Any] = {} # export: table or sql, format; drop_column: table, column; ask: question
+
+class Job(BaseModel):
+    id: int
+    database_id: int
+    kind: str
+    status: str # queued, running, completed, failed, cancelled
+    params: Dict[str, Any]
+    progress: Dict[str, Any]
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 # Base schema for User
 class UserBase(BaseModel):
     username: str
@@ -46,13 +153,11 @@ class UserBase(BaseModel):
 class UserCreate(UserBase):
     password: str
 
-# Schema for reading user data (excludes password, includes ID and status)
-class User(UserBase):
+# Schema for reading user data without related records (excludes password, includes ID and status)
+class UserProfile(UserBase):
     id: int
     is_active: bool
-    databases: List[Database] = []
 
-    # Enable ORM mode to read data from SQLAlchemy models
     class Config:
         from_attributes = True
 
@@ -68,7 +173,17 @@ class TokenData(BaseModel):
 class AIQueryRequest(BaseModel):
     question: str
 
+class AIExportRequest(BaseModel):
+    sql_query: str # sql_query returned by /ask
+
 class AIQueryResponse(BaseModel):
     sql_query: str
     results: Optional[List[Dict[str, Any]]] = None
-    error: Optional[str] = None
\ No newline at end of file
+    columns: Optional[List[str]] = None # With layout=columnar, "columns" and "rows" replace "results"
+    rows: Optional[List[List[Any]]] = None
+    error: Optional[str] = None
+    sql_cached: bool = False # SQL reused from an identical earlier question
+    results_cached: bool = False # Results reused because the data has not changed since
+    truncated: bool = False # More rows matched than the row cap allows
+    elapsed_ms: Optional[float] = None # Execution time of the SQL
+    rows_scanned: Optional[int] = None # Estimated from the query plan
\ No newline at end of file
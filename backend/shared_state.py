@@ -0,0 +1,119 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process write lock, SQLite's busy timeout still applies
+    fcntl = None
+
+# Number of server processes (set by the `python -m backend` entry point)
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", "1"))
+MULTI_WORKER = BACKEND_WORKERS > 1
+# SQLite file holding counters shared by all worker processes; in-memory counters if unset
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")
+# Lock files used to serialize writers across processes
+SHARED_LOCK_DIR = os.getenv("SHARED_LOCK_DIR", "locks")
+
+
+class LocalCounters:
+    """Named counters in process memory (single-process mode)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, int] = {}
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = self._values.get(key, 0) + 1
+            self._values[key] = value
+            return value
+
+
+class SqliteCounters:
+    """
+    Named counters in a small SQLite file that every worker process opens.
+    Each thread keeps its own connection; an increment is a single upsert.
+    The counters only version in-memory caches, so they skip fsync (synchronous=OFF).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with sqlite3.connect(path, timeout=5) as conn:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=OFF;")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> int:
+        row = self._conn().execute("SELECT value FROM counters WHERE key = ?;", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key: str) -> int:
+        return self._conn().execute(
+            "INSERT INTO counters (key, value) VALUES (?, 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value;",
+            (key,),
+        ).fetchone()[0]
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(SHARED_LOCK_DIR, f"{hashlib.sha1(name.encode()).hexdigest()}.lock")
+
+
+class ProcessLock:
+    """
+    Exclusive lock on a file, held across processes (fcntl.flock).
+    Only one thread per process may use a given instance at a time.
+    """
+
+    def __init__(self, name: str):
+        os.makedirs(SHARED_LOCK_DIR, exist_ok=True)
+        self.path = _lock_path(name)
+        self._file = None
+
+    def __enter__(self):
+        if self._file is None:
+            self._file = open(self.path, "a")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def process_lock(name: str):
+    """A ProcessLock for name in multi-worker mode, otherwise None (one process needs no lock)."""
+    if not MULTI_WORKER or fcntl is None:
+        return None
+    return ProcessLock(name)
+
+
+def remove_process_lock(name: str):
+    """Deletes the lock file for name once it is no longer needed (its database was deleted)."""
+    try:
+        os.remove(_lock_path(name))
+    except FileNotFoundError:
+        pass
+
+
+# Shared counters used for data versions and cache invalidation
+counters = SqliteCounters(SHARED_STATE_PATH) if SHARED_STATE_PATH else LocalCounters()
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+import metrics
+
+# Pool sizing. Each user database keeps up to POOL_MAX_IDLE_PER_DB idle
+# connections, and at most POOL_MAX_DATABASES databases are kept open at once.
+POOL_MAX_DATABASES = int(os.getenv("SQLITE_POOL_MAX_DATABASES", "64"))
+POOL_MAX_IDLE_PER_DB = int(os.getenv("SQLITE_POOL_MAX_IDLE_PER_DB", "4"))
+# Connections one database (per mode) may have checked out at once; further callers wait
+# up to POOL_CHECKOUT_TIMEOUT_SECONDS for one to be returned
+POOL_MAX_CHECKED_OUT_PER_DB = int(os.getenv("SQLITE_POOL_MAX_CHECKED_OUT_PER_DB", "16"))
+POOL_CHECKOUT_TIMEOUT_SECONDS = float(os.getenv("SQLITE_POOL_CHECKOUT_TIMEOUT_SECONDS", "30"))
+
+# Per-connection tuning applied once when a connection is opened.
+BUSY_TIMEOUT_SECONDS = float(os.getenv("SQLITE_BUSY_TIMEOUT_SECONDS", "5"))
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", "8192"))
+
+
+class _DatabaseSlot:
+    """Idle connections and checkout count for a single database file."""
+
+    def __init__(self, lock: threading.Lock):
+        self.idle = []
+        self.checked_out = 0
+        # Signalled whenever a checkout ends; shares the pool lock
+        self.returned = threading.Condition(lock)
+
+    def check_in(self):
+        """Ends a checkout. Caller holds the pool lock."""
+        self.checked_out -= 1
+        self.returned.notify()
+
+
+class ConnectionPool:
+    """
+    Keeps long-lived SQLite connections per database file.
+    Connections are checked out by one thread at a time and returned afterwards,
+    so they can safely be shared across FastAPI's threadpool.
+    """
+
+    def __init__(
+        self,
+        max_databases: int = POOL_MAX_DATABASES,
+        max_idle_per_db: int = POOL_MAX_IDLE_PER_DB,
+        max_checked_out_per_db: int = POOL_MAX_CHECKED_OUT_PER_DB,
+        checkout_timeout: float = POOL_CHECKOUT_TIMEOUT_SECONDS,
+    ):
+        self.max_databases = max_databases
+        self.max_idle_per_db = max_idle_per_db
+        self.max_checked_out_per_db = max_checked_out_per_db
+        self.checkout_timeout = checkout_timeout
+        self._lock = threading.Lock()
+        # (filepath, readonly) -> slot, ordered from least to most recently used
+        self._slots: "OrderedDict[tuple, _DatabaseSlot]" = OrderedDict()
+        self.opened = 0
+        self.checkouts = 0
+
+    def _open(self, filepath: str, readonly: bool) -> sqlite3.Connection:
+        """Opens a new connection and applies the per-connection PRAGMAs."""
+        with metrics.sqlite_open_seconds.time(mode="ro" if readonly else "rw"):
+            conn = self._connect(filepath, readonly)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def _connect(self, filepath: str, readonly: bool) -> sqlite3.Connection:
+        if readonly:
+            # mode=ro makes SQLite itself refuse writes; query_only also blocks PRAGMA writes
+            uri = f"file:{pathname2url(os.path.abspath(filepath))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+            conn.execute("PRAGMA query_only=1;")
+        else:
+            conn = sqlite3.connect(filepath, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE};")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB};")
+        return conn
+
+    def _evict_idle_databases(self):
+        """Closes idle databases (least recently used first) until under the limit. Caller holds the lock."""
+        if len(self._slots) <= self.max_databases:
+            return
+        for key in list(self._slots):
+            if len(self._slots) <= self.max_databases:
+                break
+            slot = self._slots[key]
+            if slot.checked_out:
+                continue
+            for conn in slot.idle:
+                conn.close()
+            del self._slots[key]
+
+    def acquire(self, filepath: str, readonly: bool = False):
+        """
+        Checks out a connection for filepath. Returns (connection, slot).
+        Waits while max_checked_out_per_db connections are out, and raises sqlite3.OperationalError
+        if none is returned within checkout_timeout seconds.
+        """
+        key = (filepath, readonly)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = _DatabaseSlot(self._lock)
+                self._slots[key] = slot
+                self._evict_idle_databases()
+            else:
+                self._slots.move_to_end(key)
+            deadline = time.monotonic() + self.checkout_timeout
+            while slot.checked_out >= self.max_checked_out_per_db:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise sqlite3.OperationalError(f"Timed out waiting for a connection to {os.path.basename(filepath)}")
+                slot.returned.wait(remaining)
+            slot.checked_out += 1
+            self.checkouts += 1
+            conn = slot.idle.pop() if slot.idle else None
+
+        if conn is None:
+            try:
+                conn = self._open(filepath, readonly)
+            except Exception:
+                with self._lock:
+                    slot.check_in()
+                raise
+        return conn, slot
+
+    def release(self, filepath: str, conn: sqlite3.Connection, slot: _DatabaseSlot, readonly: bool = False):
+        """Returns a connection to the pool, closing it if it is no longer wanted."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            conn.set_progress_handler(None, 0)
+        except sqlite3.Error:
+            # A broken connection is never returned to the pool
+            with self._lock:
+                slot.check_in()
+            conn.close()
+            return
+
+        with self._lock:
+            slot.check_in()
+            # The slot is stale if the database was invalidated while checked out
+            keep = self._slots.get((filepath, readonly)) is slot and len(slot.idle) < self.max_idle_per_db
+            if keep:
+                slot.idle.append(conn)
+            else:
+                self._evict_idle_databases()
+        if not keep:
+            conn.close()
+
+    @contextmanager
+    def connection(self, filepath: str, readonly: bool = False):
+        """
+        Context manager that checks out a connection and always returns it.
+        readonly: use a separate set of connections opened with mode=ro.
+        """
+        conn, slot = self.acquire(filepath, readonly)
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            raise
+        finally:
+            self.release(filepath, conn, slot, readonly)
+
+    def invalidate(self, filepath: str):
+        """
+        Closes all idle connections for filepath.
+        Connections currently checked out are closed when they are returned.
+        """
+        with self._lock:
+            slots = [self._slots.pop((filepath, readonly), None) for readonly in (False, True)]
+        for slot in slots:
+            if slot is None:
+                continue
+            for conn in slot.idle:
+                conn.close()
+            slot.idle = []
+
+    def close_all(self):
+        """Closes every idle connection in the pool."""
+        with self._lock:
+            slots = list(self._slots.values())
+            self._slots.clear()
+        for slot in slots:
+            for conn in slot.idle:
+                conn.close()
+            slot.idle = []
+
+
+# Shared pool used by dynamic_db and ai_agent
+pool = ConnectionPool()
+
+
+def connection(filepath: str, readonly: bool = False):
+    """Checks out a pooled connection for filepath from the shared pool."""
+    return pool.connection(filepath, readonly)
+
+
+def invalidate(filepath: str):
+    """Drops all pooled connections for filepath from the shared pool."""
+    pool.invalidate(filepath)
@@ -0,0 +1,177 @@
+import json
+import os
+import random
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import dynamic_db
+import sqlite_pool
+from cache import MISSING, TTLCache
+
+# Above this many rows, distinct counts are estimated from STATS_DISTINCT_SAMPLE_ROWS random rows
+STATS_EXACT_DISTINCT_MAX_ROWS = int(os.getenv("STATS_EXACT_DISTINCT_MAX_ROWS", "100000"))
+STATS_DISTINCT_SAMPLE_ROWS = int(os.getenv("STATS_DISTINCT_SAMPLE_ROWS", "10000"))
+# Most values returned by the group-by and distinct-value lookups
+STATS_MAX_VALUES = 1000
+STATS_CACHE_MAX_ENTRIES = int(os.getenv("STATS_CACHE_MAX_ENTRIES", "2000"))
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", "3600"))
+
+# Declared types that get an average (SQLite's type affinity rules)
+_NUMERIC_TYPE_MARKERS = ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")
+
+# (filename, data_version, kind, args) -> result
+stats_cache = TTLCache(STATS_CACHE_MAX_ENTRIES, STATS_CACHE_TTL_SECONDS)
+
+
+def _is_numeric(column_type: Optional[str]) -> bool:
+    column_type = (column_type or "").upper()
+    return any(marker in column_type for marker in _NUMERIC_TYPE_MARKERS)
+
+
+def _valid_columns(filename: str, table_name: str) -> List[Dict[str, Any]]:
+    columns = dynamic_db.get_columns(filename, table_name)
+    if not columns:
+        raise ValueError(f"Table '{table_name}' not found")
+    return columns
+
+
+def _check_column(filename: str, table_name: str, column_name: str):
+    if column_name not in {col["name"] for col in _valid_columns(filename, table_name)}:
+        raise ValueError(f"Invalid column: {column_name}")
+
+
+def _check_limit(limit: int):
+    if limit < 1 or limit > STATS_MAX_VALUES:
+        raise ValueError(f"limit must be between 1 and {STATS_MAX_VALUES}")
+
+
+def _cached(filename: str, kind: str, args: tuple, compute):
+    """
+    Returns a cached result for the database's current data version, computing it on a miss.
+    The version is read before computing, so a write that lands meanwhile only makes the entry unreachable.
+    """
+    key = (filename, dynamic_db.get_data_version(filename), kind, args)
+    result = stats_cache.get(key)
+    if result is MISSING:
+        result = compute()
+        stats_cache.set(key, result)
+    return result
+
+
+def _sample_rows(conn, table_name: str, columns: List[str]) -> List[tuple]:
+    """Up to STATS_DISTINCT_SAMPLE_ROWS rows picked by random rowid across the whole table (one lookup each)."""
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table_name};").fetchone()
+    if low is None:
+        return []
+    span = range(low, high + 1)
+    rowids = random.sample(span, min(STATS_DISTINCT_SAMPLE_ROWS, len(span)))
+    return conn.execute(
+        f"SELECT {', '.join(columns)} FROM {table_name} WHERE rowid IN (SELECT value FROM json_each(?));",
+        (json.dumps(rowids),),
+    ).fetchall()
+
+
+def _estimate_distinct(values: List[Any], non_null: int) -> int:
+    """
+    Bias-corrected Chao1 estimate of the distinct non-NULL values in a column from a sample of them:
+    d + f1 * (f1 - 1) / (2 * (f2 + 1)), where f1 and f2 count the values seen once and twice.
+    Capped at the column's non-NULL count.
+    """
+    frequencies = Counter(Counter(values).values())
+    f1, f2 = frequencies.get(1, 0), frequencies.get(2, 0)
+    seen = sum(frequencies.values())
+    return min(non_null, round(seen + f1 * (f1 - 1) / (2 * (f2 + 1))))
+
+
+def _compute_table_stats(filename: str, table_name: str) -> Dict[str, Any]:
+    columns = _valid_columns(filename, table_name)
+    # One scan for every column's counts and extremes
+    aggregates = ["COUNT(*)"]
+    for col in columns:
+        name = col["name"]
+        aggregates += [f"COUNT({name})", f"MIN({name})", f"MAX({name})"]
+        aggregates.append(f"AVG({name})" if _is_numeric(col["type"]) else "NULL")
+
+    with sqlite_pool.connection(dynamic_db.get_db_path(filename), readonly=True) as conn:
+        summary = conn.execute(f"SELECT {', '.join(aggregates)} FROM {table_name};").fetchone()
+        row_count = summary[0]
+        estimated = row_count > STATS_EXACT_DISTINCT_MAX_ROWS
+        names = [col["name"] for col in columns]
+        if estimated:
+            sample = _sample_rows(conn, table_name, names)
+        else:
+            distinct = conn.execute(f"SELECT {', '.join(f'COUNT(DISTINCT {name})' for name in names)} FROM {table_name};").fetchone()
+
+    stats = []
+    for i, col in enumerate(columns):
+        non_null, minimum, maximum, average = summary[1 + 4 * i:5 + 4 * i]
+        if estimated:
+            distinct_count = _estimate_distinct([row[i] for row in sample if row[i] is not None], non_null)
+        else:
+            distinct_count = distinct[i]
+        stats.append({
+            "name": col["name"],
+            "type": col["type"],
+            "null_count": row_count - non_null,
+            "min": minimum,
+            "max": maximum,
+            "avg": average,
+            "distinct": distinct_count,
+        })
+    return {"table": table_name, "row_count": row_count, "distinct_estimated": estimated, "columns": stats}
+
+
+def get_table_stats(filename: str, table_name: str) -> Dict[str, Any]:
+    """
+    Row count and per-column null count, min, max, average (numeric columns) and distinct count.
+    Distinct counts of tables larger than STATS_EXACT_DISTINCT_MAX_ROWS are estimated from a random sample.
+    """
+    return _cached(filename, "table", (table_name,), lambda: _compute_table_stats(filename, table_name))
+
+
+def get_group_counts(filename: str, table_name: str, column_name: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Rows per value of a column (NULL included), most frequent first."""
+    _check_limit(limit)
+
+    def compute():
+        _check_column(filename, table_name, column_name)
+        with sqlite_pool.connection(dynamic_db.get_db_path(filename), readonly=True) as conn:
+            rows = conn.execute(
+                f"SELECT {column_name}, COUNT(*) FROM {table_name} "
+                f"GROUP BY {column_name} ORDER BY 2 DESC, 1 LIMIT ?;",
+                (limit,),
+            ).fetchall()
+        return [{"value": value, "count": count} for value, count in rows]
+
+    return _cached(filename, "groups", (table_name, column_name, limit), compute)
+
+
+def _escape_like(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_distinct_values(filename: str, table_name: str, column_name: str, prefix: str = "", limit: int = 100) -> List[Any]:
+    """
+    Sorted distinct non-NULL values of a column, for dropdowns and autocompletion.
+    prefix keeps only values starting with it (case-insensitive for ASCII, like LIKE).
+    """
+    _check_limit(limit)
+
+    def compute():
+        _check_column(filename, table_name, column_name)
+        query = f"SELECT DISTINCT {column_name} FROM {table_name} WHERE {column_name} IS NOT NULL"
+        params: List[Any] = []
+        if prefix:
+            query += f" AND {column_name} LIKE ? ESCAPE '\\'"
+            params.append(_escape_like(prefix) + "%")
+        query += f" ORDER BY {column_name} LIMIT ?;"
+        params.append(limit)
+        with sqlite_pool.connection(dynamic_db.get_db_path(filename), readonly=True) as conn:
+            return [row[0] for row in conn.execute(query, params).fetchall()]
+
+    return _cached(filename, "distinct", (table_name, column_name, prefix, limit), compute)
+
+
+def forget_database(filename: str):
+    """Drops the cached statistics of a deleted database."""
+    stats_cache.discard_matching(lambda key, _: key[0] == filename)
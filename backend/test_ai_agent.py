@@ -0,0 +1,45 @@
+import os
+import sqlite3
+
+import pytest
+
+os.environ.setdefault("AGENT_API_KEY", "test")
+os.environ.setdefault("AI_BACKEND", "stub")
+
+import ai_agent  # noqa: E402
+
+
+@pytest.fixture
+def two_tables(tmp_path, monkeypatch):
+    """Tables a and b with 5,000 rows each; a x b is over a 10M-row limit, a + b is not."""
+    monkeypatch.setattr(ai_agent, "AI_QUERY_MAX_SCAN_ROWS", 10_000_000)
+    filepath = str(tmp_path / "plan.sqlite")
+    conn = sqlite3.connect(filepath)
+    for table in ("a", "b"):
+        conn.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, v INTEGER);")
+        conn.executemany(f"INSERT INTO {table} (v) VALUES (?);", ((i,) for i in range(5000)))
+    conn.commit()
+    yield conn, filepath
+    conn.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT v FROM a UNION ALL SELECT v FROM b",
+    "SELECT (SELECT count(*) FROM a), (SELECT count(*) FROM b)",
+    "SELECT * FROM a WHERE v IN (SELECT v FROM b WHERE v < 5)",
+])
+def test_independent_branches_add_up(two_tables, sql):
+    conn, filepath = two_tables
+    assert ai_agent.check_query_plan(conn, filepath, sql) == 10_000
+
+
+def test_nested_scans_are_rejected(two_tables):
+    conn, filepath = two_tables
+    with pytest.raises(ValueError, match="a x b"):
+        ai_agent.check_query_plan(conn, filepath, "SELECT * FROM a, b")
+
+
+def test_correlated_subquery_runs_per_outer_row(two_tables):
+    conn, filepath = two_tables
+    with pytest.raises(ValueError, match="25,000,000"):
+        ai_agent.check_query_plan(conn, filepath, "SELECT * FROM a WHERE EXISTS (SELECT 1 FROM b WHERE b.v + 1 = a.v + 1)")
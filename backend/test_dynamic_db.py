@@ -0,0 +1,72 @@
+import base64
+import json
+import os
+
+import pytest
+
+os.environ.setdefault("AGENT_API_KEY", "test")
+
+import dynamic_db  # noqa: E402
+
+
+@pytest.fixture
+def people(tmp_path, monkeypatch):
+    """A database with a 'people' table of 10 rows, in a temporary user_databases directory."""
+    monkeypatch.setattr(dynamic_db, "USER_DB_DIR", str(tmp_path))
+    filename = "people.sqlite"
+    dynamic_db.create_table(filename, "people", [{"name": "name", "type": "TEXT"}, {"name": "age", "type": "INTEGER"}])
+    dynamic_db.insert_rows(filename, "people", ["name", "age"], ((f"p{i}", i) for i in range(10)))
+    return filename
+
+
+def _token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+@pytest.mark.parametrize("order_by, key", [
+    ("id", 5),
+    ("id", [[1]]),
+    ("id", []),
+    ("id", [1, 2]),
+    ("age", [3]),
+    ("age", [3, 4, 5]),
+    ("age", [{"a": 1}, 4]),
+])
+def test_tampered_cursor_is_rejected(people, order_by, key):
+    cursor = _token({"o": order_by, "d": False, "k": key})
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        dynamic_db.query_rows(people, "people", cursor=cursor, order_by=order_by)
+
+
+def test_cursor_resumes_after_last_row(people):
+    first = dynamic_db.query_rows(people, "people", limit=4, order_by="age")
+    second = dynamic_db.query_rows(people, "people", limit=4, cursor=first["next_cursor"], order_by="age")
+    assert [row["age"] for row in second["rows"]] == [4, 5, 6, 7]
+
+
+def test_failed_import_keeps_indexes(people):
+    dynamic_db.create_index(people, "people", ["age"])
+    dynamic_db.create_index(people, "people", ["name"], unique=True)
+    before = dynamic_db.get_indexes(people, "people")
+
+    def rows():
+        yield from ((f"q{i}", i) for i in range(5))
+        raise ValueError("Could not parse the file")
+
+    with pytest.raises(ValueError, match="parse"):
+        dynamic_db.insert_rows(people, "people", ["name", "age"], rows(), batch_size=2)
+    with pytest.raises(ValueError, match="rejected"):
+        dynamic_db.insert_rows(people, "people", ["name", "age"], [("q1", 1), ("p3", 3)], batch_size=1)
+
+    assert dynamic_db.get_indexes(people, "people") == before
+    assert len(dynamic_db.get_rows(people, "people")) == 10
+
+
+def test_row_numbers_do_not_hide_a_row_number_column(people):
+    dynamic_db.delete_rows(people, "people", [1, 2])
+    assert [row["row_number"] for row in dynamic_db.get_rows(people, "people", row_numbers=True)][:2] == [1, 2]
+
+    dynamic_db.create_table(people, "ranked", [{"name": "row_number", "type": "INTEGER"}])
+    dynamic_db.insert_rows(people, "ranked", ["row_number"], [(10,), (20,)])
+    rows = dynamic_db.get_rows(people, "ranked", row_numbers=True)
+    assert [(row["__row_number"], row["row_number"]) for row in rows] == [(1, 10), (2, 20)]
@@ -0,0 +1,140 @@
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+import shared_state
+import sqlite_pool
+
+# Most queued writes committed together in one transaction
+WRITE_GROUP_MAX = int(os.getenv("WRITE_GROUP_MAX", "256"))
+# A writer thread exits after this long without work and is restarted on demand
+WRITER_IDLE_SECONDS = float(os.getenv("WRITER_IDLE_SECONDS", "30"))
+
+
+class _Writer:
+    """Single writer thread for one database file."""
+
+    def __init__(self, pool: "WriterPool", filepath: str):
+        self.pool = pool
+        self.filepath = filepath
+        self.queue: "queue.Queue[tuple]" = queue.Queue()
+        # With several worker processes, their writers for the same file take turns instead of
+        # contending for SQLite's write lock (None in single-process mode)
+        self.process_lock = shared_state.process_lock(filepath)
+        self.thread = threading.Thread(target=self._run, name=f"writer:{os.path.basename(filepath)}", daemon=True)
+
+    def _run(self):
+        while True:
+            try:
+                first = self.queue.get(timeout=WRITER_IDLE_SECONDS)
+            except queue.Empty:
+                if self.pool._retire(self):
+                    if self.process_lock is not None:
+                        self.process_lock.close()
+                    return
+                continue
+            group = [first]
+            while len(group) < WRITE_GROUP_MAX:
+                try:
+                    group.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit_group(group)
+
+    def _commit_group(self, group: List[tuple]):
+        """
+        Runs every queued operation in one transaction. Each operation gets its own savepoint,
+        so a failing operation is rolled back and reported without affecting the others.
+        """
+        results = []
+        try:
+            with self.process_lock or nullcontext(), sqlite_pool.connection(self.filepath) as conn:
+                conn.execute("BEGIN IMMEDIATE;")
+                for op, future in group:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    conn.execute("SAVEPOINT queued_write;")
+                    try:
+                        results.append((future, op(conn), None))
+                        conn.execute("RELEASE SAVEPOINT queued_write;")
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO SAVEPOINT queued_write;")
+                        conn.execute("RELEASE SAVEPOINT queued_write;")
+                        results.append((future, None, e))
+                conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in the group was written
+            for op, future in group:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        with self.pool._lock:
+            self.pool.groups += 1
+            self.pool.writes += len(results)
+        if self.pool.after_commit is not None and any(error is None for _, _, error in results):
+            self.pool.after_commit(self.filepath)
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+class WriterPool:
+    """
+    Serializes writes per database file through one writer thread each.
+    Writes that queue up while a transaction is running are group-committed in the next one,
+    so concurrent writers never contend for SQLite's write lock and commits are amortized.
+    after_commit(filepath) is called after every group that changed something.
+    """
+
+    def __init__(self, after_commit: Optional[Callable[[str], Any]] = None):
+        self.after_commit = after_commit
+        self._lock = threading.Lock()
+        self._writers: Dict[str, _Writer] = {}
+        self.groups = 0
+        self.writes = 0
+
+    def submit(self, filepath: str, op: Callable[[sqlite3.Connection], Any]) -> Future:
+        """
+        Queues op(conn) to run in the database's writer thread inside a transaction.
+        op must not commit. Returns a concurrent.futures.Future with op's return value.
+        """
+        future: Future = Future()
+        with self._lock:
+            writer = self._writers.get(filepath)
+            if writer is None:
+                writer = _Writer(self, filepath)
+                self._writers[filepath] = writer
+                writer.thread.start()
+            writer.queue.put((op, future))
+        return future
+
+    def _retire(self, writer: _Writer) -> bool:
+        """Removes an idle writer, unless work arrived in the meantime."""
+        with self._lock:
+            if not writer.queue.empty():
+                return False
+            if self._writers.get(writer.filepath) is writer:
+                del self._writers[writer.filepath]
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            writers = len(self._writers)
+            queued = sum(writer.queue.qsize() for writer in self._writers.values())
+            groups, writes = self.groups, self.writes
+        return {
+            "writers": writers,
+            "queued": queued,
+            "groups": groups,
+            "writes": writes,
+            "average_group_size": writes / groups if groups else 0.0,
+        }